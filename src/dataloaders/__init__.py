@@ -1,5 +1,7 @@
 import os
 import os.path as osp
+import copy
+import logging
 from omegaconf import DictConfig
 from torch.utils.data import DataLoader
 
@@ -7,8 +9,13 @@ import dataloaders.img_transforms as T
 import dataloaders.seq_transforms as ST
 
 from .dataset_loader import ImageDataset, read_image, get_transform
-from .samplers import select_sampler, RandomSampler
+from .clip_frames import ClipFrameDataset, ClipWindowLoader, OrderedClipLoader
+from .hard_examples import HardExampleRegistry, write_hard_examples
+from .samplers import select_sampler, RandomSampler, SequentialClipSampler
 from datasets import select_dataset
+from utils import tuning_key, load_tuned_settings
+
+log = logging.getLogger(__name__)
 
 def build_img_transforms(cfg):
     transform_train = T.Compose([
@@ -21,7 +28,17 @@ def build_img_transforms(cfg):
     ])
     return transform_train, transform_test
 
+def build_batch_transform(cfg):
+    '''
+    normalization of the uint8 windows loaded with dataloader.uint8_frames=True, None otherwise
+    '''
+    if not cfg['dataloader']['uint8_frames']:
+        return None
+    return T.BatchImageTransform(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225], rgb_diff=cfg['model']['rgb_diff'])
+
 def build_seq_transforms(cfg):
+    if cfg['dataloader']['heatmap']['sparse'] and cfg['transform']['train']['crop']['p'] > 0:
+        raise ValueError('transform.train.crop is not supported with dataloader.heatmap.sparse=True')
     transform_train = ST.SeqTransformCompose([
         ST.RandomHorizontalFlipping(cfg['transform']['train']['horizontal_flip']['p']),
         ST.RandomCropping(p=cfg['transform']['train']['crop']['p'], max_rescale=cfg['transform']['train']['crop']['max_rescale']),
@@ -29,9 +46,24 @@ def build_seq_transforms(cfg):
     transform_test = None
     return transform_train, transform_test
 
+def apply_tuned_settings(
+    cfg: DictConfig,
+):
+    if not cfg['dataloader']['tuning']['auto_apply']:
+        return cfg
+    settings = load_tuned_settings(cfg['dataloader']['tuning']['cache_path'], tuning_key(cfg))
+    if settings is None:
+        return cfg
+    cfg = copy.deepcopy(cfg)
+    cfg['dataloader']['sampler']['inference_video_batch_size'] = settings['inference_video_batch_size']
+    cfg['dataloader']['inference_video_num_workers']           = settings['inference_video_num_workers']
+    log.info('tuned settings for {} applied: inference_video_batch_size={}, inference_video_num_workers={}'.format(tuning_key(cfg), settings['inference_video_batch_size'], settings['inference_video_num_workers']))
+    return cfg
+
 def build_dataloader( 
     cfg: DictConfig,
 ):
+    cfg     = apply_tuned_settings(cfg)
     dataset = select_dataset(cfg)
 
     transform_train, transform_test         = build_img_transforms(cfg)
@@ -40,7 +72,7 @@ def build_dataloader(
     input_wh  = (cfg['model']['inp_width'], cfg['model']['inp_height'])
     output_wh = (cfg['model']['out_width'], cfg['model']['out_height'])
 
-    train_sampler, test_sampler, train_clip_samplers, test_clip_samplers = select_sampler(cfg['dataloader']['sampler'], dataset)
+    train_sampler, test_sampler, train_clip_samplers, test_clip_samplers = select_sampler(cfg['dataloader']['sampler'], dataset, num_workers=cfg['dataloader']['inference_video_num_workers'])
     
     model_name = cfg['model']['name']
 
@@ -92,6 +124,9 @@ def build_dataloader(
     else:
         raise ValueError('unknwon model_name : {}'.format(model_name))
 
+    if isinstance(train_sampler, RandomSampler):
+        # weights of hard examples, e.g. fp1 frames written by update_fp1_example
+        train_sampler.hard_examples = train_dataset.fp1_examples
 
     train_loader = DataLoader(dataset=train_dataset,
                               batch_sampler=train_sampler,
@@ -102,20 +137,37 @@ def build_dataloader(
                              num_workers=cfg['dataloader']['test_num_workers'],
                              pin_memory=False)
 
-    train_clip_loaders_and_gts = {}
-    for key, clip_dataset in train_clip_datasets.items():
+    def build_clip_loader(clip, clip_dataset, clip_sampler):
+        if cfg['dataloader']['reuse_clip_frames']:
+            frame_dataset = ClipFrameDataset(cfg, 
+                                             dataset=clip, 
+                                             input_wh=input_wh, 
+                                             output_wh=output_wh, 
+                                             transform=transform_test, 
+                                             )
+            return ClipWindowLoader(cfg, 
+                                    frame_dataset, 
+                                    batch_size=cfg['dataloader']['sampler']['inference_video_batch_size'], 
+                                    num_workers=cfg['dataloader']['inference_video_num_workers'])
+        if isinstance(clip_sampler, SequentialClipSampler):
+            return OrderedClipLoader(clip_dataset, 
+                                     clip_sampler, 
+                                     num_workers=cfg['dataloader']['inference_video_num_workers'], 
+                                     max_held_batches=cfg['dataloader']['sampler']['inference_video_max_held_batches'])
         clip_loader = DataLoader(dataset=clip_dataset,
-                                 batch_sampler=train_clip_samplers[key],
+                                 batch_sampler=clip_sampler,
                                  num_workers=cfg['dataloader']['inference_video_num_workers'],
                                  pin_memory=False)
+        return clip_loader
+
+    train_clip_loaders_and_gts = {}
+    for key, clip_dataset in train_clip_datasets.items():
+        clip_loader = build_clip_loader(dataset.train_clips[key], clip_dataset, train_clip_samplers[key])
         train_clip_loaders_and_gts[key] = {'clip_loader': clip_loader, 'clip_gt': dataset.train_clip_gts[key]}
 
     test_clip_loaders_and_gts = {}
     for key, clip_dataset in test_clip_datasets.items():
-        clip_loader = DataLoader(dataset=clip_dataset,
-                                 batch_sampler=test_clip_samplers[key],
-                                 num_workers=cfg['dataloader']['inference_video_num_workers'],
-                                 pin_memory=False)
+        clip_loader = build_clip_loader(dataset.test_clips[key], clip_dataset, test_clip_samplers[key])
         test_clip_loaders_and_gts[key] = {'clip_loader': clip_loader, 'clip_gt': dataset.test_clip_gts[key]}
 
     return train_loader, test_loader, train_clip_loaders_and_gts, test_clip_loaders_and_gts
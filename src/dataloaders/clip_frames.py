@@ -0,0 +1,198 @@
+import logging
+from collections import defaultdict
+import numpy as np
+from PIL import Image
+import cv2
+import torch
+from torch.utils.data import Dataset, DataLoader
+from torch.utils.data.dataloader import default_collate
+
+from utils import read_image
+from .dataset_loader import get_transform
+from .frame_store import build_frame_store
+
+log = logging.getLogger(__name__)
+
+class ClipFrameDataset(Dataset):
+    '''
+    frames of the windows of a clip, each of which is read and transformed once even if windows overlap
+    '''
+    def __init__(self, 
+                 cfg, 
+                 dataset, 
+                 input_wh, 
+                 output_wh=None, 
+                 transform=None, 
+    ):
+        self._transform  = transform
+        self._input_wh   = input_wh
+        self._output_wh  = input_wh if output_wh is None else output_wh
+        self._out_scales = cfg['model']['out_scales']
+        self._frame_store = build_frame_store(cfg, self._input_wh)
+        self._uint8_frames = cfg['dataloader']['uint8_frames']
+
+        self._frame_paths = []
+        self._windows     = []
+        fids = {}
+        for seq in dataset:
+            for img_path in seq['frames']:
+                if not img_path in fids.keys():
+                    fids[img_path] = len(self._frame_paths)
+                    self._frame_paths.append(img_path)
+            self._windows.append(( [ fids[img_path] for img_path in seq['frames'] ], [ anno['frame_path'] for anno in seq['annos'] ] ))
+
+    def __len__(self):
+        return len(self._frame_paths)
+
+    @property
+    def windows(self):
+        return self._windows
+
+    def __getitem__(self, index):
+        value = None
+        if self._frame_store is not None:
+            value = self._frame_store.get(self._frame_paths[index])
+        if value is None:
+            img    = np.array(read_image(self._frame_paths[index]))
+            img_hw = img.shape[:2]
+            img    = cv2.warpAffine(img, get_transform(img, self._input_wh), self._input_wh, flags=cv2.INTER_LINEAR)
+        else:
+            img, img_hw = value
+
+        dummy = np.empty((img_hw[0], img_hw[1], 3), dtype=np.uint8)
+        trans_outputs_inv = {}
+        out_w, out_h = self._output_wh
+        for scale in self._out_scales:
+            trans_outputs_inv[scale] = get_transform(dummy, (out_w, out_h), inv=1)
+            out_w = out_w // 2
+            out_h = out_h // 2
+
+        if self._uint8_frames:
+            img_t = torch.from_numpy(np.ascontiguousarray(img.transpose(2, 0, 1)))
+        else:
+            img_t = self._transform(Image.fromarray(img))
+        return img_t, trans_outputs_inv
+
+class ClipWindowLoader(object):
+    '''
+    yields batches of windows in the order of the clip, like the clip loader of ImageDataset, 
+    from frames kept in a buffer keyed by frame index until no later window uses them.
+    targets (heatmaps, positions and visibilities) are not loaded.
+    '''
+    def __init__(self, 
+                 cfg, 
+                 dataset, 
+                 batch_size=8, 
+                 num_workers=0,
+    ):
+        self._dataset    = dataset
+        self._batch_size = batch_size
+        # uint8 frames are differenced after normalization by BatchImageTransform
+        self._rgb_diff   = cfg['model']['rgb_diff'] and not cfg['dataloader']['uint8_frames']
+        self._frame_loader = DataLoader(dataset=dataset, 
+                                        batch_size=batch_size, 
+                                        shuffle=False, 
+                                        num_workers=num_workers, 
+                                        pin_memory=False)
+
+    @property
+    def dataset(self):
+        return self._dataset
+
+    def __len__(self):
+        return (len(self._dataset.windows) + self._batch_size - 1) // self._batch_size
+
+    def _collate(self, windows):
+        imgs   = torch.stack([ imgs_t for imgs_t, _, _ in windows ], dim=0)
+        trans  = {}
+        for scale in windows[0][1].keys():
+            trans[scale] = torch.stack([ trans_[scale] for _, trans_, _ in windows ], dim=0)
+        frames_out = len(windows[0][2])
+        img_paths  = [ tuple([ img_paths_[ie] for _, _, img_paths_ in windows ]) for ie in range(frames_out) ]
+        return imgs, None, trans, None, None, img_paths
+
+    def __iter__(self):
+        frame_iter = iter(self._frame_loader)
+        buf        = {}
+        num_loaded = 0
+        windows    = []
+        for fids, img_paths in self._dataset.windows:
+            while num_loaded <= max(fids):
+                imgs_t, trans = next(frame_iter)
+                for i in range(imgs_t.shape[0]):
+                    buf[num_loaded] = (imgs_t[i], { scale: mats[i] for scale, mats in trans.items() })
+                    num_loaded += 1
+            for fid in [ fid for fid in buf.keys() if fid < min(fids) ]:
+                del buf[fid]
+
+            imgs_t = [ buf[fid][0] for fid in fids ]
+            if self._rgb_diff:
+                imgs_t[0] = torch.abs(imgs_t[1] - imgs_t[0])
+            windows.append((torch.cat(imgs_t, dim=0), buf[fids[0]][1], img_paths))
+            if len(windows)==self._batch_size:
+                yield self._collate(windows)
+                windows = []
+        if len(windows) > 0:
+            yield self._collate(windows)
+
+class _IndexedDataset(Dataset):
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __getitem__(self, index):
+        return index, self._dataset[index]
+
+def _collate_indexed(samples):
+    # the windows of a batch travel with it, whichever worker loads it
+    return torch.tensor([ index for index, _ in samples ]), default_collate([ sample for _, sample in samples ])
+
+class OrderedClipLoader(object):
+    '''
+    yields the batches of a SequentialClipSampler in the order of windows. 
+    batches are keyed by the window indices they carry, and at most max_held_batches wait for their predecessors: 
+    beyond that the next batch is loaded in this process, and its copy from the workers is dropped.
+    '''
+    def __init__(self, dataset, sampler, num_workers=0, max_held_batches=8):
+        self._dataset          = dataset
+        self._sampler          = sampler
+        self._max_held_batches = max_held_batches
+        self._loader = DataLoader(dataset=_IndexedDataset(dataset), 
+                                  batch_sampler=sampler, 
+                                  num_workers=num_workers, 
+                                  collate_fn=_collate_indexed, 
+                                  pin_memory=False)
+
+    @property
+    def dataset(self):
+        return self._dataset
+
+    @property
+    def sampler(self):
+        return self._sampler
+
+    def __len__(self):
+        return len(self._sampler)
+
+    def __iter__(self):
+        ends       = dict(self._sampler.window_ranges)
+        held       = {}
+        dropped    = set()
+        next_start = 0
+        for indices, batch in self._loader:
+            start = indices[0].item()
+            if start in dropped:
+                dropped.remove(start)
+                continue
+            held[start] = batch
+            while next_start in held.keys() or (len(held) > self._max_held_batches and next_start in ends.keys()):
+                if next_start in held.keys():
+                    batch_ = held.pop(next_start)
+                else:
+                    batch_ = default_collate([ self._dataset[i] for i in range(next_start, ends[next_start]) ])
+                    dropped.add(next_start)
+                    log.debug('windows [{}, {}) loaded in place of the workers'.format(next_start, ends[next_start]))
+                next_start = ends[next_start]
+                yield batch_
@@ -14,13 +14,17 @@ import torchvision.transforms.functional as TF
 from utils import read_image
 from utils.image import get_affine_transform, affine_transform
 from .heatmaps import select_heatmap_generator
+from .frame_cache import FrameCache
+from .frame_store import build_frame_store
+from .hard_examples import HardExampleRegistry
 
 log = logging.getLogger(__name__)
 
-def get_transform(img, input_wh, inv=0):
+def get_transform(img, input_wh, inv=0, center=None, scale=None):
+    # the whole frame by default, a region of width scale centered at center otherwise
     h,w,_ = img.shape
-    c     = np.array([w / 2., h / 2.], dtype=np.float32)
-    s     = max(h, w) * 1.0
+    c     = np.array([w / 2., h / 2.], dtype=np.float32) if center is None else np.array(center, dtype=np.float32)
+    s     = max(h, w) * 1.0 if scale is None else scale * 1.0
     input_w, input_h = input_wh
     trans = get_affine_transform(c, s, 0, [input_w, input_h], inv=inv)
     return trans 
@@ -49,11 +53,26 @@ class ImageDataset(Dataset):
         self._input_wh      = input_wh
         self._output_wh     = input_wh if output_wh is None else output_wh
 
-        self._fp1_fpath = fp1_fpath
+        self._fp1_examples = None
+        if fp1_fpath is not None:
+            self._fp1_examples = HardExampleRegistry(fp1_fpath)
 
         self._hm_generator = select_heatmap_generator(cfg['dataloader']['heatmap'])
+        # targets of training examples are rasterized by the loss
+        self._sparse_targets = is_train and cfg['dataloader']['heatmap']['sparse']
 
         self._is_train      = is_train
+        self._uint8_frames  = cfg['dataloader']['uint8_frames']
+
+        self._frame_store = build_frame_store(cfg, self._input_wh)
+        self._frame_cache = None
+        max_mb = cfg['dataloader']['frame_cache']['max_mb']
+        if not is_train and cfg['detector']['step'] < cfg['model']['frames_in']:
+            # test and clip windows overlap, each frame is read by several of them
+            max_mb = max(max_mb, cfg['dataloader']['frame_cache']['overlap_max_mb'])
+        if max_mb > 0:
+            self._frame_cache = FrameCache(int(max_mb * 2**20), 
+                                           log_interval=cfg['dataloader']['frame_cache']['log_interval'])
 
         if is_train:
             self._color_jitter_p          = cfg['transform']['train']['color_jitter']['p']
@@ -79,14 +98,43 @@ class ImageDataset(Dataset):
     def __len__(self):
         return len(self._dataset)
 
+    @property
+    def fp1_examples(self):
+        return self._fp1_examples
+
+    @property
+    def frame_cache(self):
+        return self._frame_cache
+
+    def _read_warped_image(self, img_path):
+        '''
+        returns the frame warped to the input size and the size of the original frame
+        '''
+        if self._frame_store is not None:
+            # a read-only view of the memory-mapped store
+            value = self._frame_store.get(img_path)
+            if value is not None:
+                return value
+
+        key = (img_path, self._input_wh)
+        if self._frame_cache is not None:
+            value = self._frame_cache.get(key)
+            if value is not None:
+                return value
+
+        img    = np.array(read_image(img_path))
+        img_hw = img.shape[:2]
+        img    = cv2.warpAffine(img, get_transform(img, self._input_wh), self._input_wh, flags=cv2.INTER_LINEAR)
+        if self._frame_cache is not None:
+            # cached frames are shared by windows, so they must not be modified
+            img.flags.writeable = False
+            self._frame_cache.put(key, (img, img_hw), img.nbytes)
+        return img, img_hw
+
     def __getitem__(self, index):
-        
-        fp1_im_list = []
-        if self._fp1_fpath is not None:
-            if osp.exists(self._fp1_fpath):
-                with open(self._fp1_fpath, 'r') as f:
-                    data = f.read().split('\n')
-                    fp1_im_list = data[:-1]
+        if self._fp1_examples is not None:
+            # a stat per sample, the list is parsed only after update_fp1_example rewrites it
+            self._fp1_examples.reload_if_modified()
 
         img_paths = self._dataset[index]['frames']
         annos     = self._dataset[index]['annos']
@@ -110,34 +158,35 @@ class ImageDataset(Dataset):
             brightness_factor, contrast_factor, saturation_factor, hue_factor = get_color_jitter_factors(self._color_jitter_brightness, self._color_jitter_contrast, self._color_jitter_saturation, self._color_jitter_hue)
 
         imgs, xys, visis = [], [], []
-        hms = defaultdict(list)
+        hms = {}
 
         for idx, img_path in enumerate(img_paths):
-            img = read_image(img_path)
+            img, img_hw = self._read_warped_image(img_path)
             
             if trans_input is None:
-                trans_input  = get_transform(np.asarray(img), self._input_wh)
+                # only the size of the original frame is needed
+                dummy = np.empty((img_hw[0], img_hw[1], 3), dtype=np.uint8)
+                trans_input  = get_transform(dummy, self._input_wh)
                 out_w, out_h = self._output_wh
                 for scale in self._out_scales:
-                    trans_outputs[scale] = get_transform(np.asarray(img), (out_w, out_h))
+                    trans_outputs[scale] = get_transform(dummy, (out_w, out_h))
                     out_w = out_w // 2
                     out_h = out_h // 2
 
                 if not self._is_train:
-                    trans_input_inv = get_transform(np.asarray(img), self._input_wh, inv=1)
+                    trans_input_inv = get_transform(dummy, self._input_wh, inv=1)
                     out_w, out_h    = self._output_wh
                     for scale in self._out_scales:
-                        trans_outputs_inv[scale] = get_transform(np.asarray(img), (out_w, out_h), inv=1)
+                        trans_outputs_inv[scale] = get_transform(dummy, (out_w, out_h), inv=1)
                         out_w = out_w // 2
                         out_h = out_h // 2
 
-            img = Image.fromarray( cv2.warpAffine(np.array(img), trans_input, self._input_wh, flags=cv2.INTER_LINEAR) )
             imgs.append(img)
 
         # hms (targets)
         for idx, (img_path, anno) in enumerate(zip(img_paths, annos)):
             binary = True
-            if img_path in fp1_im_list:
+            if self._fp1_examples is not None and img_path in self._fp1_examples:
                 binary = False
 
             px, py = anno['center'].xy
@@ -147,47 +196,62 @@ class ImageDataset(Dataset):
             visis.append(visi)
             out_w, out_h = self._output_wh
             for scale in self._out_scales:
+                if scale not in hms.keys():
+                    if self._sparse_targets:
+                        hms[scale] = np.zeros((len(annos), 6), dtype=np.float32)
+                    else:
+                        hms[scale] = np.zeros((len(annos), out_h, out_w), dtype=np.float32)
+                ct_int = (-1, -1)
                 if visi:
                     ct     = affine_transform(np.array([px,py]), trans_outputs[scale])
                     ct_int = ct.astype(np.int32)
-                    hm     = self._hm_generator((out_w,out_h), ct_int, binary=binary)
+                if self._sparse_targets:
+                    # (cx, cy, visible, binary, w, h), rasterized by the loss
+                    hms[scale][idx] = [ct_int[0], ct_int[1], ct_int[0] >= 0 and ct_int[1] >= 0, binary, out_w, out_h]
                 else:
-                    hm     = self._hm_generator((out_w,out_h), (-1.,-1.))
-
-                hm = np.expand_dims(hm, axis=0)
-                hms[scale].append(hm)
+                    self._hm_generator((out_w,out_h), ct_int, binary=binary, out=hms[scale][idx])
                 out_w = out_w // 2
                 out_h = out_h // 2
 
+        # color jitter of uint8 training examples is applied in batch by BatchImageTransform
+        batch_jitter = self._uint8_frames and self._is_train
+        jitter       = torch.tensor([1., 1., 1., 0.])
+        if apply_color_jitter and batch_jitter:
+            jitter = torch.tensor([brightness_factor, contrast_factor, saturation_factor, hue_factor], dtype=torch.float32)
+
         imgs_t = []
         hms_t  = defaultdict(list)
         for img in imgs:
+            if not self._uint8_frames or (apply_color_jitter and not batch_jitter):
+                img = Image.fromarray(img)
             # color gitter (data augmentation)
-            if apply_color_jitter:
+            if apply_color_jitter and not batch_jitter:
                 img = TF.adjust_brightness(img, brightness_factor)
                 img = TF.adjust_contrast(img, contrast_factor)
                 img = TF.adjust_saturation(img, saturation_factor)
                 img = TF.adjust_hue(img, hue_factor)
-            img_t = self._transform(img)
+            if self._uint8_frames:
+                img_t = torch.from_numpy(np.ascontiguousarray(np.asarray(img).transpose(2, 0, 1)))
+            else:
+                img_t = self._transform(img)
             imgs_t.append(img_t)
         for scale in self._out_scales:
-            for hm in hms[scale]:
-                hm_t = torch.tensor(hm)
-                hms_t[scale].append(hm_t)
+            hms_t[scale] = torch.from_numpy(hms[scale])
         
         if self._rgb_diff:
             if len(imgs_t)!=2:
                 raise ValueError('assume 2 images are input but {} given'.format(len(imgs_t)))
-            imgs_t[0] = torch.abs(imgs_t[1] - imgs_t[0])
+            if not self._uint8_frames:
+                imgs_t[0] = torch.abs(imgs_t[1] - imgs_t[0])
 
         imgs_t = torch.cat(imgs_t, dim=0)
-        for scale in self._out_scales:
-            hms_t[scale] = torch.cat(hms_t[scale], dim=0)
         if self._seq_transform is not None:
             imgs_t, hms_t = self._seq_transform(imgs_t, hms_t)
         xys   = torch.tensor(xys)
         visis = torch.tensor(visis)
-        if self._is_train:
+        if self._is_train and self._uint8_frames:
+            return imgs_t, hms_t, jitter
+        elif self._is_train:
             return imgs_t, hms_t
         else:
             return imgs_t, hms_t, trans_outputs_inv, xys, visis, img_paths_out
@@ -0,0 +1,57 @@
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+class FrameCache(object):
+    '''
+    LRU cache of frames with a byte budget. 
+    a dataset holds one, so each dataloader worker process has its own copy.
+    '''
+    def __init__(self, max_bytes, log_interval=0):
+        self._max_bytes    = max_bytes
+        self._log_interval = log_interval
+        self._frames       = OrderedDict()
+        self._num_bytes    = 0
+        self._hits         = 0
+        self._misses       = 0
+
+    def get(self, key):
+        value = None
+        if key in self._frames.keys():
+            value, _ = self._frames[key]
+            self._hits += 1
+            self._frames.move_to_end(key)
+        else:
+            self._misses += 1
+        if self._log_interval > 0 and (self._hits + self._misses) % self._log_interval==0:
+            log.info('frame cache: hit rate {:.3f} ({} hits, {} misses), {} frames, {:.1f}MB'.format(self.hit_rate, self._hits, self._misses, len(self._frames), self._num_bytes/2**20))
+        return value
+
+    def put(self, key, value, num_bytes):
+        if num_bytes > self._max_bytes:
+            return
+        if key in self._frames.keys():
+            return
+        self._frames[key] = (value, num_bytes)
+        self._num_bytes  += num_bytes
+        while self._num_bytes > self._max_bytes:
+            _, (_, num_bytes_) = self._frames.popitem(last=False)
+            self._num_bytes   -= num_bytes_
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def hit_rate(self):
+        num_lookups = self._hits + self._misses
+        return self._hits / num_lookups if num_lookups > 0 else 0.
+
+    @property
+    def num_bytes(self):
+        return self._num_bytes
@@ -0,0 +1,66 @@
+import os
+import os.path as osp
+import re
+import json
+import hashlib
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+def parse_frame_id(frame_name):
+    name = osp.splitext(frame_name)[0]
+    try:
+        return int(name)
+    except ValueError:
+        numbers = re.findall(r'\d+', name)
+        return int(numbers[-1]) if numbers else -1
+
+def frame_store_name(clip_dir, input_wh):
+    digest = hashlib.sha1(osp.abspath(clip_dir).encode('utf-8')).hexdigest()[:16]
+    return '{}_{}x{}'.format(digest, input_wh[0], input_wh[1])
+
+class FrameStore(object):
+    '''
+    frames of clip directories packed by runner=pack_frames: 
+    <name>.npy holds the frames of a clip warped to input_wh (N x H x W x 3, uint8) and 
+    <name>.json is the index (frame names and ids, size of the original frames and the input transform).
+    arrays are memory-mapped when a frame of the clip is first requested, so each worker maps its own.
+    '''
+    def __init__(self, root_dir, input_wh):
+        self._root_dir = root_dir
+        self._input_wh = tuple(input_wh)
+        self._clips    = {}
+
+    def _open(self, clip_dir):
+        name       = frame_store_name(clip_dir, self._input_wh)
+        index_path = osp.join(self._root_dir, '{}.json'.format(name))
+        if not osp.exists(index_path):
+            return None
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        frames = np.load(osp.join(self._root_dir, '{}.npy'.format(name)), mmap_mode='r')
+        return {'frames': frames, 
+                'orig_hw': tuple(index['orig_hw']), 
+                'fids': { frame_name: i for i, frame_name in enumerate(index['frame_names']) }}
+
+    def get(self, img_path):
+        '''
+        returns a view of the warped frame and the size of the original frame, None if not packed
+        '''
+        clip_dir, frame_name = osp.split(img_path)
+        if not clip_dir in self._clips.keys():
+            self._clips[clip_dir] = self._open(clip_dir)
+        clip = self._clips[clip_dir]
+        if clip is None or not frame_name in clip['fids'].keys():
+            return None
+        return clip['frames'][clip['fids'][frame_name]], clip['orig_hw']
+
+def build_frame_store(cfg, input_wh):
+    root_dir = cfg['dataloader']['frame_store']['root_dir']
+    if root_dir is None:
+        return None
+    if not osp.isdir(root_dir):
+        log.warning('frame store {} not found, so frames are decoded'.format(root_dir))
+        return None
+    return FrameStore(root_dir, input_wh)
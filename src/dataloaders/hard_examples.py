@@ -0,0 +1,73 @@
+import os
+import os.path as osp
+import logging
+
+log = logging.getLogger(__name__)
+
+class HardExampleRegistry(object):
+    '''
+    hard examples (e.g. fp1 frames) listed in a text file, one path per line with an optional tab-separated weight.
+    weights are sampling weights of the training windows with the example (RandomSampler), default_weight if omitted.
+    the file is parsed once and again only when its mtime or size changes.
+    it is loaded on construction, so forked dataloader workers start from the parsed copy.
+    '''
+    def __init__(self, fpath, default_weight=1.):
+        self._fpath          = fpath
+        self._default_weight = default_weight
+        self._stamp          = None
+        self._weights        = {}
+        self.reload_if_modified()
+
+    def _read_stamp(self):
+        try:
+            st = os.stat(self._fpath)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload_if_modified(self):
+        stamp = self._read_stamp()
+        if stamp==self._stamp:
+            return False
+        weights = {}
+        if stamp is not None:
+            with open(self._fpath, 'r') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if len(line)==0:
+                        continue
+                    path, _, weight = line.partition('\t')
+                    weights[path] = float(weight) if len(weight) > 0 else self._default_weight
+        self._weights = weights
+        self._stamp   = stamp
+        log.debug('{} hard examples loaded from {}'.format(len(self._weights), self._fpath))
+        return True
+
+    def __contains__(self, img_path):
+        return img_path in self._weights
+
+    def __len__(self):
+        return len(self._weights)
+
+    def weight(self, img_path, default=1.):
+        '''
+        weight of a listed example, default for the others
+        '''
+        return self._weights.get(img_path, default)
+
+    @property
+    def weights(self):
+        return self._weights
+
+def write_hard_examples(fpath, img_paths, weights=None):
+    '''
+    replaces the file atomically, so that readers never see a partial list
+    '''
+    tmp_fpath = '{}.tmp{}'.format(fpath, os.getpid())
+    with open(tmp_fpath, 'w') as f:
+        for i, path in enumerate(img_paths):
+            if weights is None:
+                f.write('{}\n'.format(path))
+            else:
+                f.write('{}\t{}\n'.format(path, weights[i]))
+    os.replace(tmp_fpath, fpath)
@@ -1,23 +1,54 @@
 from typing import Tuple
 import numpy as np
 
-from utils import gen_binary_map, gen_heatmap
+from utils import gen_binary_map, gen_heatmap, gen_stamp, paste_stamp
 
 class BinaryFixedSizeMapGenerator:
     def __init__(self, cfg):
         self._sigma     = cfg['sigmas'][0]
         self._data_type = np.float32
         self._min_value = cfg['min_value']
-        
+        # stamps around an integer center, keyed by binary
+        self._stamps    = {}
+
+    @property
+    def sigma(self):
+        return self._sigma
+
+    @property
+    def min_value(self):
+        return self._min_value
+
+    def _stamp(self, binary):
+        if binary not in self._stamps.keys():
+            self._stamps[binary] = gen_stamp(self._sigma, binary=binary, data_type=self._data_type, min_value=self._min_value)
+        return self._stamps[binary]
+
     def __call__(self, 
                  wh: Tuple[int, int],
                  cxy: Tuple[float, float],
                  binary: bool = True,
+                 out: np.ndarray = None,
                  ):
-        if binary:
-            return gen_binary_map(wh, cxy, self._sigma, self._data_type)
+        '''
+        returns the map (h, w), written to out if given
+        '''
+        w, h   = wh
+        cx, cy = cxy
+        if out is None:
+            out = np.zeros((h, w), dtype=self._data_type)
         else:
-            return gen_heatmap(wh, cxy, self._sigma, self._data_type, min_value=self._min_value)
+            out.fill(0)
+        if cx < 0 or cy < 0:
+            return out
+        if cx!=int(cx) or cy!=int(cy):
+            # stamps are shifted by whole pixels only
+            if binary:
+                out[:] = gen_binary_map(wh, cxy, self._sigma, self._data_type)
+            else:
+                out[:] = gen_heatmap(wh, cxy, self._sigma, self._data_type, min_value=self._min_value)
+            return out
+        return paste_stamp(out, self._stamp(binary), (cx, cy))
 
 class PrototypeBasedBinaryMapGenerator:
     def __init__(self, cfg):
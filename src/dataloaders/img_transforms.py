@@ -1,7 +1,9 @@
 from torchvision.transforms import *
+import torchvision.transforms.functional as TF
 from PIL import Image
 import random
 import math
+import torch
 
 class ResizeWithEqualScale(object):
     """
@@ -113,3 +115,59 @@ class RandomErasing(object):
 
         return img
 
+
+
+def _rgb_to_grayscale(imgs):
+    # the same weights as torchvision.transforms.functional.rgb_to_grayscale
+    r, g, b = imgs.unbind(dim=-3)
+    return (0.2989 * r + 0.587 * g + 0.114 * b).unsqueeze(dim=-3)
+
+class BatchImageTransform(object):
+    """
+    Normalize uint8 windows (B, F*3, H, W) of F frames in batch, the counterpart of ToTensor and Normalize applied per frame.
+    Color jitter factors per window are applied to all the frames of the window, and rgb_diff is applied after normalization.
+    Args:
+        mean (list): mean of each channel.
+        std (list): standard deviation of each channel.
+        rgb_diff (bool): replace the first frame with the absolute difference of the first two frames.
+    """
+    def __init__(self, mean, std, rgb_diff=False):
+        self._mean     = mean
+        self._std      = std
+        self._rgb_diff = rgb_diff
+
+    def _color_jitter(self, imgs, jitter):
+        """
+        Args:
+            imgs (torch tensor): images in [0, 1]. (B, F, 3, H, W)
+            jitter (torch tensor): brightness, contrast, saturation and hue factors, (1, 1, 1, 0) for no change. (B, 4)
+        """
+        jitter = jitter.to(device=imgs.device, dtype=imgs.dtype)
+        brightness, contrast, saturation = [ jitter[:, i].view(-1, 1, 1, 1, 1) for i in range(3) ]
+        imgs = (imgs * brightness).clamp(0, 1)
+        mean = _rgb_to_grayscale(imgs).mean(dim=(-3, -2, -1), keepdim=True)
+        imgs = (contrast * imgs + (1. - contrast) * mean).clamp(0, 1)
+        imgs = (saturation * imgs + (1. - saturation) * _rgb_to_grayscale(imgs)).clamp(0, 1)
+        # hue is shifted in hsv, only for the windows with a non-zero factor
+        for ib in torch.nonzero(jitter[:, 3]).flatten().tolist():
+            imgs[ib] = TF.adjust_hue(imgs[ib], jitter[ib, 3].item())
+        return imgs
+
+    def __call__(self, imgs, jitter=None):
+        """
+        Args:
+            imgs (torch tensor): uint8 windows. (B, F*3, H, W)
+            jitter (torch tensor): color jitter factors, see _color_jitter. (B, 4)
+        Returns:
+            torch tensor: normalized windows (B, F*3, H, W)
+        """
+        b, c, h, w = imgs.shape
+        imgs = imgs.to(dtype=torch.float32).div(255).view(b, c // 3, 3, h, w)
+        if jitter is not None:
+            imgs = self._color_jitter(imgs, jitter)
+        mean = torch.as_tensor(self._mean, dtype=imgs.dtype, device=imgs.device).view(-1, 1, 1)
+        std  = torch.as_tensor(self._std, dtype=imgs.dtype, device=imgs.device).view(-1, 1, 1)
+        imgs = imgs.sub(mean).div(std)
+        if self._rgb_diff:
+            imgs[:, 0] = torch.abs(imgs[:, 1] - imgs[:, 0])
+        return imgs.reshape(b, c, h, w)
@@ -1,7 +1,7 @@
 import logging
 from omegaconf import DictConfig
 
-from .samplers import ClipSampler, MatchSampler, RandomSampler
+from .samplers import ClipSampler, MatchSampler, RandomSampler, SequentialClipSampler
 
 log = logging.getLogger(__name__)
 
@@ -11,8 +11,27 @@ __sampler_factory = {
     'random': RandomSampler,
         }
 
+def build_clip_sampler(cfg: DictConfig, 
+                       clip,
+                       num_workers=0,
+):
+    if cfg['inference_video_sequential']:
+        return SequentialClipSampler(clip,
+                                     cfg['inference_video_batch_size'],
+                                     num_workers=num_workers,
+                                     batches_per_run=cfg['inference_video_batches_per_run'],
+                                     drop_last=cfg['inference_video_drop_last'],
+                                     max_held_batches=cfg['inference_video_max_held_batches']
+                                     )
+    return RandomSampler(clip,
+                         cfg['inference_video_batch_size'],
+                         shuffle_batch=cfg['inference_video_shuffle_batch'],
+                         drop_last=cfg['inference_video_drop_last']
+                         )
+
 def select_sampler(cfg: DictConfig, 
                    dataset,
+                   num_workers=0,
 ):
     #print(cfg)
     sampler_name = cfg['name']
@@ -53,22 +72,12 @@ def select_sampler(cfg: DictConfig,
     train_clips         = dataset.train_clips
     train_clip_samplers = {}
     for key, clip in train_clips.items():
-        sampler = RandomSampler(clip,
-                                cfg['inference_video_batch_size'],
-                                shuffle_batch=cfg['inference_video_shuffle_batch'],
-                                drop_last=cfg['inference_video_drop_last']
-                                )
-        train_clip_samplers[key] = sampler
+        train_clip_samplers[key] = build_clip_sampler(cfg, clip, num_workers=num_workers)
 
     test_clips         = dataset.test_clips
     test_clip_samplers = {}
     for key, clip in test_clips.items():
-        sampler = RandomSampler(clip,
-                                cfg['inference_video_batch_size'],
-                                shuffle_batch=cfg['inference_video_shuffle_batch'],
-                                drop_last=cfg['inference_video_drop_last']
-                                )
-        test_clip_samplers[key] = sampler
+        test_clip_samplers[key] = build_clip_sampler(cfg, clip, num_workers=num_workers)
 
     return train_sampler, test_sampler, train_clip_samplers, test_clip_samplers
 
@@ -9,32 +9,62 @@ log = logging.getLogger(__name__)
 class RandomSampler(Sampler):
     '''
     every batch is build randomly
+    with hard_examples, windows are drawn with replacement in proportion to the largest weight of their frames
+    as long as an example weighs other than 1
     '''
     _ret = []
-    def __init__(self, dataset, batch_size=4, shuffle_batch=True, drop_last=True):
+    def __init__(self, dataset, batch_size=4, shuffle_batch=True, drop_last=True, hard_examples=None):
         self._batch_size           = batch_size
         self._shuffle_batch        = shuffle_batch
         self._drop_last            = drop_last
+        self._hard_examples        = hard_examples
         #log.info('launch RandomSampler. batch size: {}, shuffle_batch: {}, drop_last: {}'.format(self._batch_size, self._shuffle_batch, self._drop_last))
-        self._idxs = []
+        self._idxs   = []
+        self._frames = []
         for idx, d in enumerate(dataset):
             self._idxs.append(idx)
+            self._frames.append(d['frames'])
         self._length = len(self._idxs) // self._batch_size
         if (not self._drop_last) and (len(self._idxs)%self._batch_size !=0):
             self._length += 1
         #log.info('# of batches: {}'.format(self._length) )
 
+    @property
+    def hard_examples(self):
+        return self._hard_examples
+
+    @hard_examples.setter
+    def hard_examples(self, hard_examples):
+        self._hard_examples = hard_examples
+
+    def _weights(self):
+        # None if every window weighs 1, so that batches are drawn as without weights
+        if self._hard_examples is None:
+            return None
+        self._hard_examples.reload_if_modified()
+        if len(self._hard_examples)==0:
+            return None
+        weights = [ max([ self._hard_examples.weight(img_path) for img_path in frames ]) for frames in self._frames ]
+        if all([ weight==1. for weight in weights ]):
+            return None
+        return weights
+
     def __iter__(self):
         #print(self._idxs)
         #print(self._batch_size)
         ret = []
-        if self._shuffle_batch:
-            random.shuffle(self._idxs)
-        for i in range(len(self._idxs)//self._batch_size):
-            ret.append( self._idxs[i*self._batch_size:(i+1)*self._batch_size])
-        if (not self._drop_last) and (len(self._idxs)%self._batch_size !=0):
-            start_idx = (len(self._idxs)//self._batch_size)*self._batch_size
-            ret.append( self._idxs[start_idx:])
+        weights = self._weights()
+        if weights is not None:
+            idxs = random.choices(range(len(self._frames)), weights=weights, k=len(self._frames))
+        else:
+            if self._shuffle_batch:
+                random.shuffle(self._idxs)
+            idxs = self._idxs
+        for i in range(len(idxs)//self._batch_size):
+            ret.append( idxs[i*self._batch_size:(i+1)*self._batch_size])
+        if (not self._drop_last) and (len(idxs)%self._batch_size !=0):
+            start_idx = (len(idxs)//self._batch_size)*self._batch_size
+            ret.append( idxs[start_idx:])
         return iter(ret)
 
     def __len__(self):
@@ -122,3 +152,70 @@ class ClipSampler(Sampler):
     def __len__(self):
         return self._length
 
+def _num_held_batches(window_ranges):
+    '''
+    max number of batches held to yield batches arriving in window_ranges order in the order of windows
+    '''
+    held       = set()
+    next_start = 0
+    ends       = dict(window_ranges)
+    max_held   = 0
+    for start, _ in window_ranges:
+        held.add(start)
+        while next_start in held:
+            held.remove(next_start)
+            next_start = ends[next_start]
+        max_held = max(max_held, len(held))
+    return max_held
+
+class SequentialClipSampler(Sampler):
+    '''
+    every batch is a run of contiguous windows in a clip.
+    batches are ordered such that, with the usual round robin of batches over dataloader workers, each worker gets runs of 
+    batches_per_run consecutive batches and frames shared by overlapping windows are loaded by the same worker.
+    the order only affects which worker loads which frames, batches are put back in window order by OrderedClipLoader.
+    batches_per_run is reduced so that at most max_held_batches batches wait for their predecessors.
+    window_ranges gives the windows [start, end) of each batch in the order of the sampler.
+    '''
+    def __init__(self, dataset, batch_size=8, num_workers=0, batches_per_run=4, drop_last=False, max_held_batches=8):
+        self._batch_size = batch_size
+        self._drop_last  = drop_last
+        num_windows = len(dataset)
+        chunks = [ (start, min(start+batch_size, num_windows)) for start in range(0, num_windows, batch_size) ]
+        if self._drop_last and len(chunks) > 0 and chunks[-1][1]-chunks[-1][0] < batch_size:
+            chunks = chunks[:-1]
+
+        for batches_per_run_ in range(max(1, batches_per_run), 0, -1):
+            self._window_ranges = [ chunks[c] for c in self._order(len(chunks), max(1, num_workers), batches_per_run_) ]
+            if _num_held_batches(self._window_ranges) <= max_held_batches:
+                break
+        if batches_per_run_ < batches_per_run:
+            log.debug('batches_per_run reduced from {} to {} to hold at most {} batches'.format(batches_per_run, batches_per_run_, max_held_batches))
+        self._batches_per_run = batches_per_run_
+
+    @staticmethod
+    def _order(num_chunks, num_slots, batches_per_run):
+        runs          = [ list(range(i, min(i+batches_per_run, num_chunks))) for i in range(0, num_chunks, batches_per_run) ]
+        worker_chunks = [ [ c for run in runs[w::num_slots] for c in run ] for w in range(num_slots) ]
+        # round robin while every worker has a batch, and the rest in order
+        order = []
+        num_rounds = min([ len(chunks_) for chunks_ in worker_chunks ])
+        for k in range(num_rounds):
+            for w in range(num_slots):
+                order.append(worker_chunks[w][k])
+        order.extend(sorted(set(range(num_chunks)) - set(order)))
+        return order
+
+    @property
+    def batches_per_run(self):
+        return self._batches_per_run
+
+    @property
+    def window_ranges(self):
+        return self._window_ranges
+
+    def __iter__(self):
+        return iter([ list(range(start, end)) for start, end in self._window_ranges ])
+
+    def __len__(self):
+        return len(self._window_ranges)
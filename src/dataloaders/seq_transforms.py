@@ -27,7 +27,7 @@ class RandomHorizontalFlipping(object):
         """
         Args:
             imgs (torch tensor): images to be flipped. (C, H, W)
-            hms (torch tensor): heatmaps to be flipped. (C, H, W)
+            hms (torch tensor): heatmaps to be flipped. (C, H, W), or sparse targets (C, 6) of (cx, cy, visible, binary, w, h)
         Returns:
             torch tensor: flipped images (C, H, W)
             torch tensor: flipped heatmaps (C, H, W)
@@ -40,7 +40,11 @@ class RandomHorizontalFlipping(object):
         hms_f  = {}
         #print(imgs.shape)
         for scale in hms.keys():
-            hms_f[scale] = torch.flip(hms[scale], self._dims)
+            if hms[scale].dim()==2:
+                hms_f[scale] = hms[scale].clone()
+                hms_f[scale][:, 0] = hms[scale][:, 4] - 1 - hms[scale][:, 0]
+            else:
+                hms_f[scale] = torch.flip(hms[scale], self._dims)
         return imgs_f, hms_f
 
 
@@ -1,5 +1,7 @@
 from .detector import TracknetV2Detector
 from .deepball_detector import DeepBallDetector
+from .onnx_model import OnnxModel
+from .roi import RoiCropper
 
 __factory = {
     'tracknetv2' : TracknetV2Detector,
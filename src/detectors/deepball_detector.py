@@ -9,6 +9,7 @@ from torch import nn
 
 from models import build_model
 from dataloaders import read_image, get_transform, build_img_transforms
+from utils import set_num_threads
 from utils.image import get_affine_transform, affine_transform
 #from .postprocessor import TracknetV2Postprocessor
 from .deepball_postprocessor import DeepBallPostprocessor
@@ -53,12 +54,15 @@ class DeepBallDetector(object):
         
         _, self._transform = build_img_transforms(cfg)
 
-        self._device = cfg['device']
-        if self._device!='cuda':
-            assert 0, 'device=cpu not supported'
-        if not torch.cuda.is_available():
-            assert 0, 'GPU NOT available'
-        self._gpus  = cfg['gpus']
+        self._device = cfg['runner']['device']
+        if self._device=='cuda':
+            if not torch.cuda.is_available():
+                assert 0, 'GPU NOT available'
+            self._gpus = cfg['runner']['gpus']
+        elif self._device=='cpu':
+            set_num_threads(cfg['runner']['num_threads'], cfg['runner']['num_interop_threads'])
+        else:
+            raise ValueError('unknown device: {}'.format(self._device))
         #print(self._device, self._gpus)
 
         if model is None:
@@ -70,12 +74,13 @@ class DeepBallDetector(object):
                 log.info('Checkpoint is not specified, so it is set as the best model in {}'.format(output_dir))
                 if not osp.exists(model_path):
                     FileNotFoundError('{} not found'.format(model_path))
-            checkpoint = torch.load(model_path)
+            checkpoint = torch.load(model_path, map_location=self._device)
             self._model.load_state_dict(checkpoint['model_state_dict'])
             #self._model_epoch = checkpoint['epoch']
             self._model = self._model.to(self._device)
-            self._model = nn.DataParallel(self._model, device_ids=self._gpus)
-            log.info('model is destributed to gpus {}'.format(self._gpus))
+            if self._device=='cuda':
+                self._model = nn.DataParallel(self._model, device_ids=self._gpus)
+                log.info('model is destributed to gpus {}'.format(self._gpus))
         else:
             self._model = model
 
@@ -18,6 +18,7 @@ class DeepBallPostprocessor(object):
         if self._model_name!='deepball':
             assert 0, 'model: {} not supported for now (2022.8.22)'.format(self._model_name)
         self._foreground_channel = cfg['model']['foreground_channel']
+        self._device_peak        = cfg['detector']['postprocessor']['device_peak']
         #print(self._score_threshold)
 
     """
@@ -68,22 +69,36 @@ class DeepBallPostprocessor(object):
             scores.append(score)
         return xys, scores
 
-    def run(self, preds, affine_mats):
+    def run(self, preds, affine_mats, keep_hm=False):
         results = defaultdict(lambda: defaultdict(dict))
         for scale in self._scales:
             preds_       = preds[scale]
             affine_mats_ = affine_mats[scale].cpu().numpy()
             #hms_         = preds_.sigmoid_().cpu().numpy()
-            preds_ = F.softmax(preds_, dim=1)
-            hms_   = preds_[:,self._foreground_channel:self._foreground_channel+1,:,:]
-            hms_   = hms_.cpu().numpy()
+            preds_ = F.softmax(preds_.float().contiguous(), dim=1)
+            hms_t_ = preds_[:,self._foreground_channel:self._foreground_channel+1,:,:]
+            hms_   = None
+            if not self._device_peak or keep_hm:
+                hms_ = hms_t_.cpu().numpy()
+            if self._device_peak:
+                # only the peak of each heatmap is transferred to host
+                top1_scores, _, top1_ys, top1_xs = _top1(hms_t_)
+                top1_scores = top1_scores.cpu().numpy()
+                top1_ys     = top1_ys.cpu().numpy()
+                top1_xs     = top1_xs.cpu().numpy()
 
-            b,s,h,w = hms_.shape
+            b,s,h,w = hms_t_.shape
             for i in range(b):
                 for j in range(s):
                     #print(i,j)
                     #print(hms_[i,j].shape)
-                    xys_, scores_ = self._detect_peak(hms_[i,j])
+                    if self._device_peak:
+                        xys_, scores_ = [], []
+                        if top1_scores[i,j,0] > self._score_threshold:
+                            xys_.append( np.array([int(top1_xs[i,j,0]), int(top1_ys[i,j,0])]) )
+                            scores_.append( top1_scores[i,j,0] )
+                    else:
+                        xys_, scores_ = self._detect_peak(hms_[i,j])
                     #print(xys_, scores_)
 
                     """
@@ -99,7 +114,10 @@ class DeepBallPostprocessor(object):
                         xys_t_.append( affine_transform(xy_, affine_mats_[i]))
                     #results[i][j][scale] = {'xy': xy_, 'visi': visi_, 'blob_size': blob_size_}
                     #results[i][j][scale] = {'xy': xy_, 'visi': visi_, 'blob_score': blob_score_}
-                    results[i][j][scale] = {'xys': xys_t_, 'scores': scores_, 'hm': hms_[i,j], 'trans': affine_mats_[i]}
+                    results[i][j][scale] = {'xys': xys_t_, 'scores': scores_}
+                    if keep_hm:
+                        results[i][j][scale]['hm']    = hms_[i,j]
+                        results[i][j][scale]['trans'] = affine_mats_[i]
 
         #print(results)
         return results
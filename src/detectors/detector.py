@@ -1,6 +1,7 @@
 import os.path as osp
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from hydra.core.hydra_config import HydraConfig
 import numpy as np
 from PIL import Image
@@ -9,10 +10,13 @@ import torch
 from torch import nn
 
 from models import build_model
-from dataloaders import read_image, get_transform, build_img_transforms
+from models.optimize import optimize_for_inference
+from dataloaders import read_image, get_transform, build_img_transforms, build_batch_transform
+from utils import set_num_threads
 from utils.image import get_affine_transform, affine_transform
 from .postprocessor import TracknetV2Postprocessor
 from .deepball_postprocessor import DeepBallPostprocessor
+from .onnx_model import OnnxModel
 
 log = logging.getLogger(__name__)
 
@@ -38,15 +42,38 @@ class TracknetV2Detector(object):
             raise ValueError('unknown model_name : {}'.format(model_name))
 
         _, self._transform = build_img_transforms(cfg)
+        self._batch_transform = build_batch_transform(cfg)
 
         self._device = cfg['runner']['device']
-        if self._device!='cuda':
-            assert 0, 'device=cpu not supported'
-        if not torch.cuda.is_available():
-            assert 0, 'GPU NOT available'
-        self._gpus  = cfg['runner']['gpus']
-
-        if model is None:
+        if self._device=='cuda':
+            if not torch.cuda.is_available():
+                assert 0, 'GPU NOT available'
+            self._gpus = cfg['runner']['gpus']
+        elif self._device=='cpu':
+            set_num_threads(cfg['runner']['num_threads'], cfg['runner']['num_interop_threads'])
+        else:
+            raise ValueError('unknown device: {}'.format(self._device))
+
+        self._precision     = cfg['detector']['precision']
+        self._channels_last = cfg['detector']['channels_last']
+        if not self._precision in ['fp32', 'bf16']:
+            raise ValueError('unknown precision: {}'.format(self._precision))
+
+        self._backend = cfg['detector']['backend']
+        if model is None and self._backend=='onnx':
+            onnx_path = cfg['detector']['onnx_path']
+            if onnx_path is None:
+                raise ValueError('detector.onnx_path is mandatory for detector.backend=onnx')
+            if self._precision!='fp32' or self._channels_last:
+                raise ValueError('detector.precision and detector.channels_last are not supported for detector.backend=onnx')
+            self._model = OnnxModel(onnx_path, 
+                                    cfg['model']['out_scales'], 
+                                    device=self._device, 
+                                    num_threads=cfg['runner']['num_threads'], 
+                                    num_interop_threads=cfg['runner']['num_interop_threads'])
+            if cfg['detector']['roi']['enabled'] and not self._model.dynamic_hw:
+                raise ValueError('{} has a fixed input size, so it cannot run the crops of detector.roi. export it again to run it with detector.roi.enabled=True'.format(onnx_path))
+        elif model is None and self._backend=='torch':
             self._model = build_model(cfg)
             model_path = cfg['detector']['model_path']
             if model_path is None:
@@ -55,20 +82,40 @@ class TracknetV2Detector(object):
                 log.info('Checkpoint is not specified, so it is set as the best model in {}'.format(output_dir))
                 if not osp.exists(model_path):
                     FileNotFoundError('{} not found'.format(model_path))
-            checkpoint = torch.load(model_path)
+            checkpoint = torch.load(model_path, map_location=self._device)
+            quantized  = 'quantization' in checkpoint.keys()
+            if quantized:
+                if self._device!='cpu':
+                    raise ValueError('quantized model {} runs on cpu only'.format(model_path))
+                if self._precision!='fp32' or self._channels_last:
+                    raise ValueError('detector.precision and detector.channels_last are not supported for quantized models')
+                from models.quantization import build_quantized_model
+                example_inputs = (torch.randn(1, self._frames_in*3, self._input_wh[1], self._input_wh[0]),)
+                self._model    = build_quantized_model(self._model, example_inputs, backend=checkpoint['quantization']['backend'])
+                log.info('{} is a quantized model ({})'.format(model_path, checkpoint['quantization']['backend']))
             self._model.load_state_dict(checkpoint['model_state_dict'])
             self._model = self._model.to(self._device)
-            self._model = nn.DataParallel(self._model, device_ids=self._gpus)
+            if cfg['detector']['optimize']['enabled'] and not quantized:
+                example_inputs = (torch.randn(1, self._frames_in*3, self._input_wh[1], self._input_wh[0], device=self._device),)
+                self._model    = optimize_for_inference(self._model, example_inputs, atol=cfg['detector']['optimize']['atol'])
+            if self._device=='cuda':
+                self._model = nn.DataParallel(self._model, device_ids=self._gpus)
+        elif model is None:
+            raise ValueError('unknown backend: {}'.format(self._backend))
         else:
             self._model = model
 
         self._model.eval()
+        if self._channels_last:
+            self._model = self._model.to(memory_format=torch.channels_last)
 
         postprocessor_name = cfg['detector']['postprocessor']['name']
         if not postprocessor_name in self.__postprocessor_factory.keys():
             raise KeyError('invalid dataset: {}'.format(postprocessor_name ))
         self._postprocessor = self.__postprocessor_factory[postprocessor_name](cfg)
 
+        self._pipeline_workers    = cfg['detector']['pipeline']['num_workers']
+        self._pipeline_queue_size = cfg['detector']['pipeline']['max_queue_size']
 
     @property
     def frames_in(self):
@@ -82,11 +129,26 @@ class TracknetV2Detector(object):
     def input_wh(self):
         return self._input_wh
 
-    def run_tensor(self, imgs, affine_mats):
+    @property
+    def device(self):
+        return self._device
+
+    @property
+    def model(self):
+        return self._model
+
+    def _forward(self, imgs):
         imgs  = imgs.to(self._device)
-        preds = self._model(imgs)
+        if imgs.dtype==torch.uint8:
+            # windows loaded with dataloader.uint8_frames=True
+            imgs = self._batch_transform(imgs)
+        if self._channels_last:
+            imgs = imgs.contiguous(memory_format=torch.channels_last)
+        with torch.autocast(device_type=self._device, dtype=torch.bfloat16, enabled=self._precision=='bf16'):
+            return self._model(imgs)
 
-        pp_results  = self._postprocessor.run(preds, affine_mats)
+    def _postprocess(self, preds, affine_mats, keep_hm=False):
+        pp_results  = self._postprocessor.run(preds, affine_mats, keep_hm=keep_hm)
 
         results = {}
         hms_vis = {}
@@ -101,10 +163,33 @@ class TracknetV2Detector(object):
                     xys    = pp_results[bid][eid][scale]['xys']
                     for xy, score in zip(xys, scores):
                         results[bid][eid].append({ 'xy': xy, 'score': score, 'scale': scale})
-                    
-                    hm    = pp_results[bid][eid][scale]['hm']
-                    trans = pp_results[bid][eid][scale]['trans']
-                    hms_vis[bid][eid].append({'hm': hm, 'scale': scale, 'trans': trans})
+
+                    if keep_hm:
+                        hm    = pp_results[bid][eid][scale]['hm']
+                        trans = pp_results[bid][eid][scale]['trans']
+                        hms_vis[bid][eid].append({'hm': hm, 'scale': scale, 'trans': trans})
 
         return results, hms_vis
 
+    def run_tensor(self, imgs, affine_mats, keep_hm=False):
+        preds = self._forward(imgs)
+        return self._postprocess(preds, affine_mats, keep_hm=keep_hm)
+
+    def run_tensor_pipelined(self, batches, keep_hm=False):
+        '''
+        batches yields (imgs, affine_mats, meta), and (meta, results, hms_vis) are yielded in the same order.
+        the forward of the next batches overlaps with the postprocessing of the previous ones in worker threads.
+        '''
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self._pipeline_workers) as executor:
+            for imgs, affine_mats, meta in batches:
+                preds = self._forward(imgs)
+                pending.append((meta, executor.submit(self._postprocess, preds, affine_mats, keep_hm)))
+                # bounded number of batches in flight so that memory does not grow with clip length
+                while len(pending) >= self._pipeline_queue_size:
+                    meta_, future = pending.popleft()
+                    yield (meta_,) + future.result()
+            while len(pending) > 0:
+                meta_, future = pending.popleft()
+                yield (meta_,) + future.result()
+
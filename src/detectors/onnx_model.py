@@ -0,0 +1,56 @@
+import logging
+import numpy as np
+import torch
+
+log = logging.getLogger(__name__)
+
+class OnnxModel(object):
+    '''
+    runs an exported model with onnxruntime, and returns {scale: tensor} as the pytorch models
+    '''
+    def __init__(self, 
+                 onnx_path, 
+                 out_scales, 
+                 device='cpu', 
+                 num_threads=None, 
+                 num_interop_threads=None,
+    ):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError('onnxruntime is required for detector.backend=onnx')
+
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            sess_options.intra_op_num_threads = num_threads
+        if num_interop_threads is not None:
+            sess_options.inter_op_num_threads = num_interop_threads
+        if device=='cuda':
+            providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        elif device=='cpu':
+            providers = ['CPUExecutionProvider']
+        else:
+            raise ValueError('unknown device: {}'.format(device))
+
+        self._session      = ort.InferenceSession(onnx_path, sess_options=sess_options, providers=providers)
+        self._input_name   = self._session.get_inputs()[0].name
+        # models exported before the spatial axes were made dynamic have fixed input sizes
+        self._dynamic_hw   = not all([ isinstance(dim, int) for dim in self._session.get_inputs()[0].shape[2:] ])
+        self._output_names = [ output.name for output in self._session.get_outputs() ]
+        self._out_scales   = list(out_scales)
+        if len(self._output_names)!=len(self._out_scales):
+            raise ValueError('{} has {} outputs, but out_scales={}'.format(onnx_path, len(self._output_names), self._out_scales))
+        log.info('onnx model {} loaded with {}'.format(onnx_path, self._session.get_providers()))
+
+    @property
+    def dynamic_hw(self):
+        return self._dynamic_hw
+
+    def eval(self):
+        return self
+
+    def __call__(self, imgs):
+        imgs    = imgs.detach().cpu().numpy().astype(np.float32, copy=False)
+        outputs = self._session.run(self._output_names, {self._input_name: imgs})
+        return { scale: torch.from_numpy(output) for scale, output in zip(self._out_scales, outputs) }
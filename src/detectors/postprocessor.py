@@ -2,8 +2,9 @@ from collections import defaultdict
 import numpy as np
 import cv2
 import torch
+import torch.nn.functional as F
 
-from utils.utils import _nms, _top1
+from utils.utils import _nms, _top1, _topk
 from utils.image import get_affine_transform, affine_transform
 
 class TracknetV2Postprocessor(object):
@@ -14,12 +15,18 @@ class TracknetV2Postprocessor(object):
         self._scales          = cfg['detector']['postprocessor']['scales']
         self._blob_det_method = cfg['detector']['postprocessor']['blob_det_method']
         self._use_hm_weight   = cfg['detector']['postprocessor']['use_hm_weight']
+        self._batched         = cfg['detector']['postprocessor']['batched']
+        if self._blob_det_method=='topk':
+            self._topk_k             = cfg['detector']['postprocessor']['topk']['k']
+            self._topk_nms_kernel    = cfg['detector']['postprocessor']['topk']['nms_kernel']
+            self._topk_refine_radius = cfg['detector']['postprocessor']['topk']['refine_radius']
         #self._xy_comp_method  = cfg['detector']['postprocessor']['xy_comp_method']
         #print(self._score_threshold, self._scales)
 
         #self._hm_type = cfg['target_generator']['type']
         #self._sigmas  = cfg['target_generator']['sigmas']
         self._sigmas = cfg['dataloader']['heatmap']['sigmas']
+        self._disk_offsets = {}
         #self._mags    = cfg['target_generator']['mags']
         #self._min_values = cfg['target_generator']['min_values']
         #print(hm_type, sigmas, mags, min_values)
@@ -67,7 +74,157 @@ class TracknetV2Postprocessor(object):
                 scores.append( score)
         return xys, scores
 
+    def _detect_blob_concomp_batch(self, hms):
+        '''
+        same as _detect_blob_concomp, but labels the components of all heatmaps (N,H,W) at once
+        '''
+        n, h, w = hms.shape
+        xys_all    = [ [] for _ in range(n) ]
+        scores_all = [ [] for _ in range(n) ]
+
+        # zero rows after each heatmap keep blobs of different heatmaps apart.
+        # the stride is kept even so that the 2x2 block scan of connectedComponents is aligned with each heatmap
+        # and labels come in the same order as when each heatmap is labeled alone
+        pad     = 2 - h % 2
+        stride  = h + pad
+        hms_pad = np.zeros((n, stride, w), dtype=np.float32)
+        hms_pad[:, :h] = hms
+        hms_pad = hms_pad.reshape(n*stride, w)
+        th, hm_th        = cv2.threshold(hms_pad, self._score_threshold, 1, cv2.THRESH_BINARY)
+        n_labels, labels = cv2.connectedComponents(hm_th.astype(np.uint8))
+        if n_labels <= 1:
+            return xys_all, scores_all
+
+        labels   = labels.ravel()
+        pixs     = np.flatnonzero(labels)
+        labs     = labels[pixs]
+        rows, xs = np.divmod(pixs, w)
+        fids, ys = np.divmod(rows, stride)
+        if self._use_hm_weight:
+            # weighted sums are taken per blob with np.sum as in _detect_blob_concomp, since bincount accumulates 
+            # in float64 and in another order. pixels of a blob keep the row-major order of np.where
+            order   = np.argsort(labs, kind='stable')
+            ws      = hms_pad.ravel()[pixs][order]
+            xs, ys  = xs[order], ys[order]
+            bounds  = np.searchsorted(labs[order], np.arange(1, n_labels+1))
+            scores  = []
+            blob_xs = np.empty(n_labels-1)
+            blob_ys = np.empty(n_labels-1)
+            for m in range(n_labels-1):
+                ws_m       = ws[bounds[m]:bounds[m+1]]
+                scores.append( ws_m.sum() )
+                blob_xs[m] = np.sum( xs[bounds[m]:bounds[m+1]] * ws_m ) / np.sum(ws_m)
+                blob_ys[m] = np.sum( ys[bounds[m]:bounds[m+1]] * ws_m ) / np.sum(ws_m)
+        else:
+            scores  = np.bincount(labs, minlength=n_labels)[1:]
+            blob_xs = np.bincount(labs, weights=xs, minlength=n_labels)[1:] / scores
+            blob_ys = np.bincount(labs, weights=ys, minlength=n_labels)[1:] / scores
+            # blob sizes are python ints in _detect_blob_concomp
+            scores  = scores.tolist()
+
+        blob_fids = np.zeros(n_labels, dtype=np.int64)
+        blob_fids[labs] = fids
+        for m in range(n_labels-1):
+            fid = blob_fids[m+1]
+            xys_all[fid].append( np.array([blob_xs[m], blob_ys[m]]) )
+            scores_all[fid].append( scores[m] )
+        return xys_all, scores_all
+
+    def _detect_blob_topk(self, hms):
+        '''
+        finds peaks of heatmaps (B,S,H,W) on their device, and transfers only the top-k peaks to host
+        (with small patches around them if refine_radius > 0)
+        '''
+        b, s, h, w = hms.shape
+        k = min(self._topk_k, h*w)
+        r = self._topk_refine_radius
+        topk_scores, _, topk_ys, topk_xs = _topk(_nms(hms, kernel=self._topk_nms_kernel), K=k)
+        patches = None
+        if r > 0:
+            offsets  = torch.arange(-r, r+1, device=hms.device)
+            dys, dxs = torch.meshgrid(offsets, offsets, indexing='ij')
+            # indices of (2r+1)x(2r+1) patches in the zero-padded heatmaps
+            inds    = (topk_ys.long()[..., None, None] + r + dys) * (w+2*r) + (topk_xs.long()[..., None, None] + r + dxs)
+            hms_pad = F.pad(hms, (r, r, r, r))
+            patches = hms_pad.reshape(b, s, -1).gather(2, inds.reshape(b, s, -1)).reshape(b, s, k, 2*r+1, 2*r+1)
+            patches = patches.cpu().numpy()
+        topk_scores = topk_scores.cpu().numpy()
+        topk_ys     = topk_ys.cpu().numpy()
+        topk_xs     = topk_xs.cpu().numpy()
+
+        xys_all, scores_all = [], []
+        for i in range(b):
+            for j in range(s):
+                xys, scores = [], []
+                for m in range(k):
+                    if topk_scores[i,j,m] <= self._score_threshold:
+                        break
+                    x, y  = topk_xs[i,j,m], topk_ys[i,j,m]
+                    score = topk_scores[i,j,m]
+                    if patches is not None:
+                        patch  = patches[i,j,m]
+                        dy, dx = np.where( patch > self._score_threshold )
+                        ws     = patch[dy, dx]
+                        dy, dx = dy - r, dx - r
+                        if self._use_hm_weight:
+                            score = ws.sum()
+                            x     = x + np.sum( dx * ws ) / np.sum(ws)
+                            y     = y + np.sum( dy * ws ) / np.sum(ws)
+                        else:
+                            score = ws.shape[0]
+                            x     = x + np.sum( dx ) / ws.shape[0]
+                            y     = y + np.sum( dy ) / ws.shape[0]
+                    xys.append( np.array([x, y]) )
+                    scores.append( score )
+                xys_all.append(xys)
+                scores_all.append(scores)
+        return xys_all, scores_all
+
+    def _get_disk_offsets(self, sigma):
+        # offsets (dy,dx) with dy^2+dx^2 <= sigma^2 in raster order, computed once per sigma
+        if sigma not in self._disk_offsets.keys():
+            r        = int(np.floor(sigma))
+            dys, dxs = np.mgrid[-r:r+1, -r:r+1]
+            inside   = dys**2 + dxs**2 <= sigma**2
+            self._disk_offsets[sigma] = (dys[inside], dxs[inside])
+        return self._disk_offsets[sigma]
+
     def _detect_blob_nms(self, hm, sigma):
+        '''
+        same output as _detect_blob_nms_ref, but suppression and centroiding are done on the disk around each peak.
+        hm is not modified
+        '''
+        xys, scores = [], []
+        hm_h, hm_w  = hm.shape
+        dys, dxs    = self._get_disk_offsets(sigma)
+
+        # visiting candidates in descending order (ties in raster order) gives the same peaks as repeated np.argmax
+        cands = np.flatnonzero(hm > self._score_threshold)
+        cands = cands[np.argsort(-hm.ravel()[cands], kind='stable')]
+        suppressed = np.zeros((hm_h, hm_w), dtype=bool)
+        for cand in cands:
+            cy, cx = divmod(cand, hm_w)
+            if suppressed[cy, cx]:
+                continue
+            ys, xs = cy + dys, cx + dxs
+            inside = (ys >= 0) & (ys < hm_h) & (xs >= 0) & (xs < hm_w)
+            ys, xs = ys[inside], xs[inside]
+            ws     = hm[ys, xs]
+            if self._use_hm_weight:
+                score  = ws.sum()
+                x      = np.sum( xs * ws ) / np.sum(ws)
+                y      = np.sum( ys * ws ) / np.sum(ws)
+            else:
+                score  = ws.shape[0]
+                x      = np.sum( xs ) / ws.shape[0]
+                y      = np.sum( ys ) / ws.shape[0]
+            xys.append( np.array([x, y]) )
+            scores.append( score)
+            suppressed[ys, xs] = True
+        return xys, scores
+
+    def _detect_blob_nms_ref(self, hm, sigma):
+        # original implementation, kept as reference for _detect_blob_nms (note: hm is modified)
         xys, scores  = [], []
         hm_ori       = hm.copy()
         hm_h, hm_w   = hm.shape
@@ -95,14 +252,22 @@ class TracknetV2Postprocessor(object):
             hm[dist_map<=sigma**2] = 0.
         return xys, scores
 
-    def run(self, preds, affine_mats):
+    def run(self, preds, affine_mats, keep_hm=False):
         results = defaultdict(lambda: defaultdict(dict))
         for scale in self._scales:
             preds_       = preds[scale]
             affine_mats_ = affine_mats[scale].cpu().numpy()
-            hms_         = preds_.sigmoid_().cpu().numpy()           
+            # heatmaps are upcast since bf16 outputs are too coarse for the blob scores
+            hms_t_       = preds_.float().contiguous().sigmoid_()
+            hms_         = None
+            if self._blob_det_method!='topk' or keep_hm:
+                hms_ = hms_t_.cpu().numpy()
 
-            b,s,h,w = hms_.shape
+            b,s,h,w = hms_t_.shape
+            if self._blob_det_method=='topk':
+                xys_batch, scores_batch = self._detect_blob_topk(hms_t_)
+            elif self._blob_det_method=='concomp' and self._batched:
+                xys_batch, scores_batch = self._detect_blob_concomp_batch(hms_.reshape(b*s, h, w))
             for i in range(b):
                 for j in range(s):
                     #print(i,j)
@@ -116,18 +281,23 @@ class TracknetV2Postprocessor(object):
                         #xy_, visi_, blob_score_ = self._detect_blob_gravity(hms_[i,j])
                         xys_, scores_ = self._detect_blob_gravity(hms_[i,j])
                     """
-                    if self._blob_det_method=='concomp':
+                    if self._blob_det_method=='topk' or (self._blob_det_method=='concomp' and self._batched):
+                        xys_, scores_ = xys_batch[i*s+j], scores_batch[i*s+j]
+                    elif self._blob_det_method=='concomp':
                         xys_, scores_ = self._detect_blob_concomp(hms_[i,j])
                     elif self._blob_det_method=='nms':
                         xys_, scores_ = self._detect_blob_nms(hms_[i,j], self._sigmas[scale])
                     else:
-                        raise ValueError('undefined xy_comp_method: {}'.format(self._xy_comp_method))
+                        raise ValueError('undefined blob_det_method: {}'.format(self._blob_det_method))
                     xys_t_ = []
                     for xy_ in xys_:
                         xys_t_.append( affine_transform(xy_, affine_mats_[i]))
                     #results[i][j][scale] = {'xy': xy_, 'visi': visi_, 'blob_size': blob_size_}
                     #results[i][j][scale] = {'xy': xy_, 'visi': visi_, 'blob_score': blob_score_}
-                    results[i][j][scale] = {'xys': xys_t_, 'scores': scores_, 'hm': hms_[i,j], 'trans': affine_mats_[i]}
+                    results[i][j][scale] = {'xys': xys_t_, 'scores': scores_}
+                    if keep_hm:
+                        results[i][j][scale]['hm']    = hms_[i,j]
+                        results[i][j][scale]['trans'] = affine_mats_[i]
 
         #print(results)
         return results
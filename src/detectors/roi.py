@@ -0,0 +1,90 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from dataloaders import get_transform, build_img_transforms
+
+class RoiCropper:
+    '''
+    crops windows around the position predicted by an online tracker, 
+    at the resolution of the full frame inference multiplied by zoom.
+    the crop is resampled from the frames of the window the loader already decoded and warped to the input size, 
+    so that zoom > 1 enlarges the ball without adding detail
+    '''
+    def __init__(self, cfg):
+        self._input_wh    = (cfg['model']['inp_width'], cfg['model']['inp_height'])
+        self._output_wh   = (cfg['model']['out_width'], cfg['model']['out_height'])
+        self._out_scales  = cfg['model']['out_scales']
+        self._roi_wh      = tuple(cfg['detector']['roi']['inp_wh'])
+        self._zoom        = cfg['detector']['roi']['zoom']
+        _, transform = build_img_transforms(cfg)
+        # value of the black border of normalized frames
+        self._black = transform(np.zeros((1, 1, 3), dtype=np.uint8))[:, 0, 0]
+        if cfg['model']['frames_in']!=cfg['model']['frames_out'] or cfg['model']['rgb_diff']:
+            raise ValueError('roi inference requires frames_in==frames_out and rgb_diff=False')
+        if cfg['tracker']['name']!='online':
+            raise ValueError('roi inference requires tracker=online')
+
+    @property
+    def num_pixels(self):
+        return self._roi_wh[0] * self._roi_wh[1]
+
+    def center(self, tracker):
+        '''
+        position of the next frame predicted by the track, None if the track is lost
+        '''
+        if tracker.fid==0:
+            return None
+        return tracker.track.predict(tracker.fid-1)
+
+    def crop(self, imgs, affine_mats, center):
+        '''
+        imgs is a window of the loader, (1, 3*frames_in, inp_h, inp_w) normalized or uint8, and affine_mats its full frame ones
+        '''
+        # size of the original frame, whose center is the one of the input
+        out_w, out_h = self._output_wh
+        mat   = affine_mats[self._out_scales[0]][0].numpy()
+        c0    = mat @ np.array([out_w / 2., out_h / 2., 1.])
+        w, h  = int(round(2 * c0[0])), int(round(2 * c0[1]))
+        frame = np.empty((h, w, 3), dtype=np.uint8)
+        input_frame = np.empty((self._input_wh[1], self._input_wh[0], 3), dtype=np.uint8)
+
+        scale = max(h, w) * self._roi_wh[0] / self._input_wh[0] / self._zoom
+        # the region is kept inside the frame as long as it is smaller than the frame
+        half_w, half_h = scale / 2., scale * self._roi_wh[1] / self._roi_wh[0] / 2.
+        cx = np.clip(center[0], half_w, w - half_w) if 2*half_w < w else w / 2.
+        cy = np.clip(center[1], half_h, h - half_h) if 2*half_h < h else h / 2.
+
+        # the region starts on an input pixel, so that the crop is a copy of the input pixels if zoom is 1
+        to_input = np.vstack([ get_transform(frame, self._input_wh), [0., 0., 1.] ])
+        to_frame = np.vstack([ get_transform(frame, self._input_wh, inv=1), [0., 0., 1.] ])
+        roi_w, roi_h = self._roi_wh[0] / self._zoom, self._roi_wh[1] / self._zoom
+        cx_in, cy_in, _ = to_input @ np.array([cx, cy, 1.])
+        cx_in = np.round(cx_in - roi_w / 2.) + roi_w / 2.
+        cy_in = np.round(cy_in - roi_h / 2.) + roi_h / 2.
+        cx, cy, _ = to_frame @ np.array([cx_in, cy_in, 1.])
+
+        # input pixel of each crop pixel, normalized as grid_sample expects
+        mat   = get_transform(input_frame, self._roi_wh, inv=1, center=(cx_in, cy_in), scale=roi_w)
+        ys, xs = np.meshgrid(np.arange(self._roi_wh[1]), np.arange(self._roi_wh[0]), indexing='ij')
+        src   = np.stack([xs, ys, np.ones_like(xs)], axis=-1) @ mat.T
+        grid  = (2. * src + 1.) / np.array(self._input_wh) - 1.
+        grid  = torch.from_numpy(grid[None]).to(device=imgs.device, dtype=torch.float32)
+
+        imgs_f = F.grid_sample(imgs.float(), grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+        if imgs.dtype==torch.uint8:
+            # the detector normalizes uint8 windows, whose border is 0
+            imgs_t = imgs_f.round().clamp(0, 255).to(torch.uint8)
+        else:
+            inside = F.grid_sample(torch.ones_like(imgs[:, :1]), grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+            black  = self._black.to(imgs.device).repeat(imgs.shape[1] // 3)[None, :, None, None]
+            imgs_t = imgs_f + black * (1. - inside)
+
+        affine_mats = {}
+        out_w = self._roi_wh[0] * self._output_wh[0] // self._input_wh[0]
+        out_h = self._roi_wh[1] * self._output_wh[1] // self._input_wh[1]
+        for scale_ in self._out_scales:
+            affine_mats[scale_] = torch.from_numpy(get_transform(frame, (out_w, out_h), inv=1, center=(cx, cy), scale=scale)[None])
+            out_w = out_w // 2
+            out_h = out_h // 2
+        return imgs_t, affine_mats
@@ -7,6 +7,7 @@ from .dice_loss import DiceLoss
 from .combo_loss import ComboLoss
 from .quality_focal_loss import QualityFocalLoss
 from utils.utils import _sigmoid
+from utils.heatmap import rasterize_heatmaps
 
 class HeatmapLoss(nn.Module):
 
@@ -40,6 +41,12 @@ class HeatmapLoss(nn.Module):
         else:
             raise KeyError('invalid loss: {}'.format(loss_name ))
 
+        # sparse targets (dataloader.heatmap.sparse) are rasterized as binary_fixed_size heatmaps
+        self._sigma     = cfg['dataloader']['heatmap']['sigmas'][0]
+        self._min_value = cfg['dataloader']['heatmap']['min_value']
+        if cfg['dataloader']['heatmap']['sparse'] and cfg['dataloader']['heatmap']['name']!='binary_fixed_size':
+            raise ValueError('dataloader.heatmap.sparse=True supported only with binary_fixed_size')
+
     def forward(self, inputs, targets):
         #print(inputs.shape, targets.shape)
         #inputs = _sigmoid(inputs)
@@ -47,6 +54,13 @@ class HeatmapLoss(nn.Module):
         inputs_s = {}
         for scale, inp in inputs.items():
             inputs_s[scale] = _sigmoid(inp)
-        loss   = self._loss(inputs_s, targets)
+        targets_d = {}
+        for scale, tar in targets.items():
+            if tar.dim()==3:
+                # (B, N, 6) sparse targets
+                targets_d[scale] = rasterize_heatmaps(tar, self._sigma, min_value=self._min_value)
+            else:
+                targets_d[scale] = tar
+        loss   = self._loss(inputs_s, targets_d)
         return loss
 
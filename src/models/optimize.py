@@ -0,0 +1,95 @@
+import copy
+import logging
+import torch
+from torch import nn
+import torch.fx
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+log = logging.getLogger(__name__)
+
+def _get_module(model, target):
+    for name in target.split('.'):
+        model = getattr(model, name)
+    return model
+
+def _set_module(model, target, module):
+    names = target.split('.')
+    parent = _get_module(model, '.'.join(names[:-1])) if len(names) > 1 else model
+    setattr(parent, names[-1], module)
+
+def fold_conv_bn(gm):
+    '''
+    folds BatchNorm2d into the preceding Conv2d of a traced model
+    a conv is folded only if every call of it is followed by the same bn, 
+    since modules such as the backbone of ballseg are called more than once
+    '''
+    conv_calls = {}
+    bn_calls   = {}
+    for node in gm.graph.nodes:
+        if node.op!='call_module':
+            continue
+        module = _get_module(gm, node.target)
+        if isinstance(module, nn.Conv2d):
+            conv_calls.setdefault(node.target, []).append(node)
+        elif isinstance(module, nn.BatchNorm2d):
+            bn_calls.setdefault(node.target, []).append(node)
+
+    pairs = {}
+    for bn_target, bn_nodes in bn_calls.items():
+        conv_targets = set()
+        for bn_node in bn_nodes:
+            prev = bn_node.args[0]
+            if not isinstance(prev, torch.fx.Node) or prev.op!='call_module' or prev.target not in conv_calls or len(prev.users) > 1:
+                conv_targets = None
+                break
+            conv_targets.add(prev.target)
+        if conv_targets is None or len(conv_targets)!=1:
+            continue
+        conv_target = conv_targets.pop()
+        if conv_target in pairs or len(conv_calls[conv_target])!=len(bn_nodes):
+            continue
+        bn = _get_module(gm, bn_target)
+        if not bn.track_running_stats:
+            continue
+        pairs[conv_target] = bn_target
+
+    for conv_target, bn_target in pairs.items():
+        _set_module(gm, conv_target, fuse_conv_bn_eval(_get_module(gm, conv_target), _get_module(gm, bn_target)))
+        for bn_node in bn_calls[bn_target]:
+            bn_node.replace_all_uses_with(bn_node.args[0])
+            gm.graph.erase_node(bn_node)
+    return len(pairs)
+
+def _max_abs_diff(outs_ref, outs):
+    if isinstance(outs_ref, dict):
+        return max([ _max_abs_diff(outs_ref[key], outs[key]) for key in outs_ref.keys() ])
+    if isinstance(outs_ref, (list, tuple)):
+        return max([ _max_abs_diff(out_ref, out) for out_ref, out in zip(outs_ref, outs) ])
+    return (outs_ref.float() - outs.float()).abs().max().item()
+
+@torch.no_grad()
+def optimize_for_inference(model, example_inputs, atol=1e-4):
+    '''
+    traces the model, folds conv-bn, eliminates nodes whose results are not used and freezes parameters
+    the optimized model is verified against the original one and the original one is returned on failure
+    '''
+    model = model.eval()
+    try:
+        gm = torch.fx.symbolic_trace(copy.deepcopy(model))
+    except Exception as e:
+        log.warning('optimization skipped since {} cannot be traced: {}'.format(type(model).__name__, e))
+        return model
+
+    num_folded = fold_conv_bn(gm)
+    gm.graph.eliminate_dead_code()
+    gm.delete_all_unused_submodules()
+    gm.recompile()
+    gm.eval()
+    gm.requires_grad_(False)
+
+    diff = _max_abs_diff(model(*example_inputs), gm(*example_inputs))
+    if not diff <= atol:
+        log.warning('optimization skipped since outputs of {} differ by {} (> {})'.format(type(model).__name__, diff, atol))
+        return model
+    log.info('{}: {} conv-bn pairs folded, max abs diff: {:.3g}'.format(type(model).__name__, num_folded, diff))
+    return gm
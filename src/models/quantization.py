@@ -0,0 +1,47 @@
+import copy
+import logging
+import torch
+
+log = logging.getLogger(__name__)
+
+# models that are traceable by torch.fx and run with quantized cpu kernels
+QUANTIZABLE_MODELS = ['hrnet', 'tracknetv2', 'monotrack']
+
+# torch.ao.quantization is imported when a model is quantized, since its fx API differs across torch versions
+# and importing detectors or runners must not depend on it
+
+def resolve_backend(backend):
+    '''
+    x86 is available on torch>=2.0, and fbgemm, which it extends, is used on older ones
+    '''
+    engines = torch.backends.quantized.supported_engines
+    if backend=='x86' and not 'x86' in engines and 'fbgemm' in engines:
+        log.warning('quantized engine x86 is not available on torch {}, so fbgemm is used'.format(torch.__version__))
+        return 'fbgemm'
+    if not backend in engines:
+        raise ValueError('quantized engine {} is not available on torch {} (supported: {})'.format(backend, torch.__version__, engines))
+    return backend
+
+def prepare_quantization(model, example_inputs, backend='x86'):
+    '''
+    fuses conv/bn/relu and inserts observers for post-training static quantization
+    '''
+    from torch.ao.quantization.quantize_fx import prepare_fx
+    backend = resolve_backend(backend)
+    torch.backends.quantized.engine = backend
+    model   = copy.deepcopy(model).eval()
+    try:
+        from torch.ao.quantization import get_default_qconfig_mapping
+    except ImportError:
+        # torch<1.13 takes a qconfig dict and no example inputs
+        from torch.ao.quantization import get_default_qconfig
+        return prepare_fx(model, {'': get_default_qconfig(backend)})
+    return prepare_fx(model, get_default_qconfig_mapping(backend), example_inputs)
+
+def convert_quantization(prepared_model):
+    from torch.ao.quantization.quantize_fx import convert_fx
+    return convert_fx(prepared_model)
+
+def build_quantized_model(model, example_inputs, backend='x86'):
+    # quantized graph with placeholder scales and zero points, to which a quantized state_dict is loaded
+    return convert_quantization(prepare_quantization(model, example_inputs, backend=backend))
@@ -6,6 +6,12 @@ from hydra.core.hydra_config import HydraConfig
 # from .train_and_test import Trainer
 from .eval import VideosInferenceRunner
 from .extract_frame import ExtractFrameRunner
+from .infer_video import VideoFileInferenceRunner
+from .benchmark import BenchmarkRunner
+from .export import ExportRunner
+from .quantize import QuantizeRunner
+from .tune import TuneRunner
+from .pack_frames import PackFramesRunner
 
 log = logging.getLogger(__name__)
 
@@ -13,6 +19,12 @@ __runner_factory = {
     #'train': Trainer,
     'eval': VideosInferenceRunner,
     'extract_frame': ExtractFrameRunner,
+    'infer_video': VideoFileInferenceRunner,
+    'benchmark': BenchmarkRunner,
+    'export': ExportRunner,
+    'quantize': QuantizeRunner,
+    'tune': TuneRunner,
+    'pack_frames': PackFramesRunner,
         }
 
 def select_runner(
@@ -0,0 +1,245 @@
+import os.path as osp
+import copy
+import time
+import tempfile
+import logging
+from omegaconf import DictConfig
+import numpy as np
+import torch
+
+from dataloaders import get_transform, build_dataloader
+from detectors import build_detector, OnnxModel
+from detectors.postprocessor import TracknetV2Postprocessor
+from models import build_model
+
+from .base import BaseRunner
+from .export import export_onnx, check_onnx_parity
+from .eval import VideosInferenceRunner
+from .runner_utils import log_drift
+
+log = logging.getLogger(__name__)
+
+def _synchronize(device):
+    if device=='cuda':
+        torch.cuda.synchronize()
+
+def _dummy_inputs(cfg, batch_size):
+    frames_in  = cfg['model']['frames_in']
+    inp_w, inp_h = cfg['model']['inp_width'], cfg['model']['inp_height']
+    imgs = torch.randn(batch_size, frames_in*3, inp_h, inp_w)
+
+    dummy = np.empty((inp_h, inp_w, 3), dtype=np.uint8)
+    out_w, out_h = cfg['model']['out_width'], cfg['model']['out_height']
+    affine_mats = {}
+    for scale in cfg['model']['out_scales']:
+        trans = get_transform(dummy, (out_w, out_h), inv=1)
+        affine_mats[scale] = torch.from_numpy(np.stack([trans]*batch_size, axis=0))
+        out_w = out_w // 2
+        out_h = out_h // 2
+    return imgs, affine_mats
+
+def _measure(fn, device, warmup_iters, num_iters):
+    for _ in range(warmup_iters):
+        fn()
+    _synchronize(device)
+    t_start = time.time()
+    for _ in range(num_iters):
+        fn()
+    _synchronize(device)
+    return time.time() - t_start
+
+@torch.no_grad()
+def benchmark_model(cfg):
+    '''
+    throughput of the detector (forward only and forward + postprocess) over a sweep of thread counts
+    '''
+    device       = cfg['runner']['device']
+    batch_size   = cfg['runner']['batch_size']
+    warmup_iters = cfg['runner']['warmup_iters']
+    num_iters    = cfg['runner']['num_iters']
+
+    model = None
+    if cfg['detector']['model_path'] is None:
+        log.info('detector.model_path is not specified, so randomly initialized weights are used')
+        model = build_model(cfg).to(device)
+    detector = build_detector(cfg, model=model)
+
+    imgs, affine_mats = _dummy_inputs(cfg, batch_size)
+    imgs       = imgs.to(device)
+    num_frames = batch_size * detector.frames_in * num_iters
+
+    if device=='cpu':
+        thread_list = cfg['runner']['sweep_threads']
+        if thread_list is None:
+            thread_list = [torch.get_num_threads()]
+    else:
+        thread_list = [None]
+
+    log.info('model={}, device={}, batch_size={}, input={}x{}'.format(cfg['model']['name'], device, batch_size, cfg['model']['inp_width'], cfg['model']['inp_height']))
+    log.info('| threads | forward FPS | forward FPS/core | end-to-end FPS | end-to-end FPS/core |')
+    for num_threads in thread_list:
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        t_forward = _measure(lambda: detector.model(imgs), device, warmup_iters, num_iters)
+        t_e2e     = _measure(lambda: detector.run_tensor(imgs, affine_mats), device, warmup_iters, num_iters)
+        fps_forward = num_frames / t_forward
+        fps_e2e     = num_frames / t_e2e
+        if num_threads is None:
+            log.info('| - | {:.1f} | - | {:.1f} | - |'.format(fps_forward, fps_e2e))
+        else:
+            log.info('| {} | {:.1f} | {:.2f} | {:.1f} | {:.2f} |'.format(num_threads, fps_forward, fps_forward/num_threads, fps_e2e, fps_e2e/num_threads))
+
+def _spurious_heatmaps(num_heatmaps, num_peaks, hm_wh, sigma, seed=0):
+    rng   = np.random.default_rng(seed)
+    w, h  = hm_wh
+    hms   = np.zeros((num_heatmaps, h, w), dtype=np.float32)
+    r     = int(np.ceil(3*sigma))
+    ys, xs = np.mgrid[-r:r+1, -r:r+1]
+    for hm in hms:
+        for _ in range(num_peaks):
+            cx, cy = rng.integers(r, w-r), rng.integers(r, h-r)
+            bump   = rng.uniform(0.3, 1.) * np.exp(-(xs**2 + ys**2) / (2*sigma**2))
+            hm[cy-r:cy+r+1, cx-r:cx+r+1] = np.maximum(hm[cy-r:cy+r+1, cx-r:cx+r+1], bump)
+    return hms
+
+def benchmark_blob_nms(cfg):
+    '''
+    nms blob detection against the reference implementation, on heatmaps with many spurious peaks
+    '''
+    num_heatmaps  = cfg['runner']['blob_nms']['num_heatmaps']
+    num_peaks     = cfg['runner']['blob_nms']['num_peaks']
+    hm_wh         = (cfg['model']['out_width'], cfg['model']['out_height'])
+    sigma         = cfg['dataloader']['heatmap']['sigmas'][0]
+    postprocessor = TracknetV2Postprocessor(cfg)
+
+    hms = _spurious_heatmaps(num_heatmaps, num_peaks, hm_wh, sigma, seed=cfg['seed'])
+
+    t_start = time.time()
+    results_ref = [ postprocessor._detect_blob_nms_ref(hm.copy(), sigma) for hm in hms ]
+    t_ref   = time.time() - t_start
+    t_start = time.time()
+    results = [ postprocessor._detect_blob_nms(hm, sigma) for hm in hms ]
+    t_fast  = time.time() - t_start
+
+    num_blobs = 0
+    for (xys_ref, scores_ref), (xys, scores) in zip(results_ref, results):
+        if len(xys_ref)!=len(xys) or not all( np.array_equal(xy_ref, xy) for xy_ref, xy in zip(xys_ref, xys) ) or not np.array_equal(scores_ref, scores):
+            raise RuntimeError('nms blob detection differs from the reference implementation')
+        num_blobs += len(xys)
+    log.info('{} heatmaps ({}x{}), {} blobs, identical outputs'.format(num_heatmaps, hm_wh[0], hm_wh[1], num_blobs))
+    log.info('reference: {:.1f}(ms/heatmap), fast: {:.1f}(ms/heatmap), x{:.1f}'.format(t_ref/num_heatmaps*1000, t_fast/num_heatmaps*1000, t_ref/t_fast))
+
+@torch.no_grad()
+def benchmark_onnx(cfg):
+    '''
+    cpu latency of eager pytorch and onnxruntime for the same weights
+    '''
+    batch_size   = cfg['runner']['batch_size']
+    warmup_iters = cfg['runner']['warmup_iters']
+    num_iters    = cfg['runner']['num_iters']
+    num_threads  = cfg['runner']['num_threads']
+
+    model = build_model(cfg)
+    if cfg['detector']['model_path'] is None:
+        log.info('detector.model_path is not specified, so randomly initialized weights are used')
+    else:
+        checkpoint = torch.load(cfg['detector']['model_path'], map_location='cpu')
+        model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    onnx_path = cfg['detector']['onnx_path']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if onnx_path is None:
+            onnx_path = osp.join(tmp_dir, '{}.onnx'.format(cfg['model']['name']))
+            export_onnx(model, cfg, onnx_path)
+        onnx_model = OnnxModel(onnx_path, cfg['model']['out_scales'], device='cpu', num_threads=num_threads)
+
+        max_diffs = check_onnx_parity(model, onnx_model, cfg)
+        log.info('parity: max abs diff={}'.format({ scale: '{:.2e}'.format(max_diff) for scale, max_diff in max_diffs.items() }))
+
+        imgs, _ = _dummy_inputs(cfg, batch_size)
+        t_torch = _measure(lambda: model(imgs), 'cpu', warmup_iters, num_iters)
+        t_onnx  = _measure(lambda: onnx_model(imgs), 'cpu', warmup_iters, num_iters)
+    log.info('model={}, batch_size={}, threads={}'.format(cfg['model']['name'], batch_size, torch.get_num_threads()))
+    log.info('pytorch: {:.1f}(ms/batch), onnxruntime: {:.1f}(ms/batch), x{:.2f}'.format(t_torch/num_iters*1000, t_onnx/num_iters*1000, t_torch/t_onnx))
+
+@torch.no_grad()
+def benchmark_precision(cfg):
+    '''
+    throughput and drift against the first option for each (precision, channels_last) option of the detector
+    metrics are evaluated on the clips of runner.split if a dataset is given
+    '''
+    device       = cfg['runner']['device']
+    batch_size   = cfg['runner']['batch_size']
+    warmup_iters = cfg['runner']['warmup_iters']
+    num_iters    = cfg['runner']['num_iters']
+    num_threads  = cfg['runner']['num_threads']
+    options      = cfg['runner']['precision_options']
+
+    model = None
+    if cfg['detector']['model_path'] is None:
+        log.info('detector.model_path is not specified, so randomly initialized weights are used')
+        model = build_model(cfg).to(device)
+    if device=='cpu' and num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    clip_loaders_and_gts = None
+    if 'dataset' in cfg.keys():
+        if cfg['runner']['split']=='train':
+            _, _, clip_loaders_and_gts, _ = build_dataloader(cfg)
+        else:
+            _, _, _, clip_loaders_and_gts = build_dataloader(cfg)
+
+    imgs, affine_mats = _dummy_inputs(cfg, batch_size)
+    num_frames = batch_size * cfg['model']['frames_in'] * num_iters
+
+    hms_ref     = None
+    results_ref = None
+    log.info('model={}, device={}, batch_size={}, threads={}'.format(cfg['model']['name'], device, batch_size, torch.get_num_threads()))
+    for precision, channels_last in options:
+        cfg_ = copy.deepcopy(cfg)
+        cfg_['detector']['precision']     = precision
+        cfg_['detector']['channels_last'] = channels_last
+        model_   = None if model is None else copy.deepcopy(model)
+        detector = build_detector(cfg_, model=model_)
+
+        t_forward = _measure(lambda: detector._forward(imgs), device, warmup_iters, num_iters)
+        t_e2e     = _measure(lambda: detector.run_tensor(imgs, affine_mats), device, warmup_iters, num_iters)
+        preds     = detector._forward(imgs)
+        hms       = { scale: preds[scale].float().sigmoid().cpu() for scale in cfg['model']['out_scales'] }
+        if hms_ref is None:
+            hms_ref = hms
+        max_diff  = max([ (hms[scale] - hms_ref[scale]).abs().max().item() for scale in hms.keys() ])
+        log.info('precision={}, channels_last={}: forward FPS: {:.1f}, end-to-end FPS: {:.1f}, max abs heatmap diff: {:.2e}'.format(precision, channels_last, num_frames/t_forward, num_frames/t_e2e, max_diff))
+
+        if clip_loaders_and_gts is not None:
+            results = VideosInferenceRunner(cfg_, clip_loaders_and_gts=clip_loaders_and_gts).run(model=model_)
+            if results_ref is None:
+                results_ref = results
+            log_drift(results_ref, results, txt='precision={}, channels_last={} vs precision={}, channels_last={}'.format(precision, channels_last, options[0][0], options[0][1]))
+
+__benchmark_factory = {
+    'model': benchmark_model,
+    'blob_nms': benchmark_blob_nms,
+    'onnx': benchmark_onnx,
+    'precision': benchmark_precision,
+        }
+
+def select_benchmark(benchmark_name):
+    if not benchmark_name in __benchmark_factory.keys():
+        raise KeyError('unknown benchmark: {}'.format(benchmark_name))
+    return __benchmark_factory[benchmark_name]
+
+class BenchmarkRunner(BaseRunner):
+    def __init__(self,
+                 cfg: DictConfig,
+    ):
+        super().__init__(cfg)
+        self._benchmarks = [ (benchmark_name, select_benchmark(benchmark_name)) for benchmark_name in cfg['runner']['benchmarks'] ]
+
+    def run(self):
+        for benchmark_name, benchmark_fn in self._benchmarks:
+            log.info('benchmark: {}'.format(benchmark_name))
+            benchmark_fn(self._cfg)
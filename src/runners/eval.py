@@ -1,9 +1,12 @@
 import os
 import os.path as osp
 import shutil
+import copy
 import time
 import logging
-from collections import defaultdict
+import multiprocessing as mp
+from collections import defaultdict, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 from omegaconf import DictConfig, OmegaConf
 import hydra
@@ -13,23 +16,112 @@ import torch
 from torch import nn
 import cv2
 import matplotlib.pyplot as plt
-import pandas as pd  # 添加pandas导入用于保存CSV
 
-from dataloaders import build_dataloader
-from detectors import build_detector
-from trackers import build_tracker
-from utils import mkdir_if_missing, draw_frame, gen_video, Center, Evaluator
+from dataloaders import build_dataloader, apply_tuned_settings
+from detectors import build_detector, RoiCropper
+from trackers import build_tracker, AdaptiveStride
+from utils import mkdir_if_missing, save_heatmap, save_csv_predictions, build_image_writer, Center, Evaluator, TrajectoryOverlay
 
 from .base import BaseRunner
 
 log = logging.getLogger(__name__)
 
+def _track_online(detector, tracker, batches, base_step, stride=None, roi_cropper=None, write_hms=None, max_run=1):
+    '''
+    runs the detector on windows selected online and tracks frames online, so that the track can guide the next windows.
+    stride selects the windows to run among those indexed by detector.step, and frames which no selected window covers are extrapolated by the tracker.
+    the next max_run windows are scheduled with the stride chosen after the last run and run as one batch.
+    roi_cropper runs windows one by one on a crop around the predicted position, and on the full frame when the track is lost.
+    '''
+    frames_in  = detector.frames_in
+    frames_out = detector.frames_out
+    if roi_cropper is not None:
+        # the crop center of each window depends on the track up to it
+        max_run = 1
+
+    # output frames not tracked yet: img_path -> [index, detections or None if not covered]
+    det_results  = OrderedDict()
+    result_dict  = OrderedDict()
+    planned      = deque([ base_step * k for k in range(max_run) ])
+    pending      = []
+    num_windows  = 0
+    num_forwards = 0
+    num_batches  = 0
+    num_roi      = 0
+    frame_size   = None
+
+    def flush(until):
+        while len(det_results) > 0 and next(iter(det_results.values()))[0] < until:
+            img_path, (_, preds) = det_results.popitem(last=False)
+            result_dict[img_path] = tracker.extrapolate() if preds is None else tracker.update(preds)
+
+    def run(pending):
+        nonlocal num_forwards, num_batches, num_roi
+        # no window of this run covers the frames before it
+        flush(pending[0][0])
+        center = None if roi_cropper is None else roi_cropper.center(tracker)
+        if center is None:
+            imgs_  = torch.cat([ imgs_w for _, _, imgs_w, _ in pending ], dim=0)
+            trans_ = { scale: torch.cat([ trans_w[scale] for _, _, _, trans_w in pending ], dim=0) for scale in pending[0][3].keys() }
+        else:
+            imgs_, trans_ = roi_cropper.crop(pending[0][2], pending[0][3], center)
+            num_roi += 1
+        results, hms_vis = detector.run_tensor(imgs_, trans_, keep_hm=write_hms is not None)
+        num_forwards += len(pending)
+        num_batches  += 1
+        for ib, (_, out_paths, _, _) in enumerate(pending):
+            for ie, img_path in enumerate(out_paths):
+                if det_results[img_path][1] is None:
+                    det_results[img_path][1] = []
+                det_results[img_path][1].extend(results[ib][ie])
+                if write_hms is not None:
+                    write_hms(img_path, hms_vis[ib][ie])
+        # no later window covers these frames, so the track is up to date when the stride is chosen
+        last_start = pending[-1][0]
+        flush(last_start + base_step)
+        step = base_step if stride is None else stride.next_step(tracker)
+        planned.extend([ last_start + step * k for k in range(1, max_run+1) ])
+
+    tracker.refresh()
+    for imgs, trans, img_paths in batches:
+        frame_size = imgs.shape[2] * imgs.shape[3]
+        for ib in range(imgs.shape[0]):
+            start        = num_windows * base_step
+            num_windows += 1
+            out_paths    = [ img_paths[ie][ib] for ie in range(frames_in-frames_out, frames_in) ]
+            for ie, img_path in enumerate(out_paths):
+                if not img_path in det_results.keys():
+                    det_results[img_path] = [start+ie, None]
+            if len(planned)==0 or start < planned[0]:
+                continue
+
+            # the first window at or after the planned start
+            while len(planned) > 0 and planned[0] <= start:
+                planned.popleft()
+            pending.append((start, out_paths, imgs[ib:ib+1], { scale: mats[ib:ib+1] for scale, mats in trans.items() }))
+            if len(planned)==0:
+                run(pending)
+                pending = []
+    if len(pending) > 0:
+        # the clip ends before the run is complete
+        planned.clear()
+        run(pending)
+    flush(np.inf)
+
+    if stride is not None:
+        log.info('adaptive stride: {} of {} windows run in {} batches'.format(num_forwards, num_windows, num_batches))
+    if roi_cropper is not None and num_forwards > 0:
+        num_pixels = (num_forwards - num_roi) * frame_size + num_roi * roi_cropper.num_pixels
+        log.info('roi: {} of {} windows cropped, {:.1f}% of the full frame pixels processed'.format(num_roi, num_forwards, 100. * num_pixels / (num_forwards * frame_size)))
+    return result_dict, num_forwards
+
 @torch.no_grad()
 def inference_video(detector, 
                     tracker, 
                     dataloader,
                     cfg,
                     vis_frame_dir=None, 
+                    vis_save_frames=False,
                     vis_hm_dir=None, 
                     vis_traj_path=None,
                     evaluator_all=None, 
@@ -50,149 +142,186 @@ def inference_video(detector,
     t_start     = time.time()
 
     det_results = defaultdict(list)
-    hm_results  = defaultdict(list)
+    # heatmaps are kept only for visualization and written as soon as they are computed
+    keep_hm     = vis_hm_dir is not None
+    hm_counts   = defaultdict(int)
+    image_writer = None
+    if keep_hm or (vis_frame_dir is not None and vis_save_frames):
+        image_writer = build_image_writer(cfg)
     rescale     = -1.
     num_frames = 0
-    for batch_idx, (imgs, hms, trans, xys_gt, visis_gt, img_paths) in enumerate(tqdm(dataloader, desc='[(CLIP-WISE INFERENCE)]' )):
 
-        num_frames += imgs.shape[0] * frames_in
-        if rescale < 0:
-            rescale = trans[0][0,0,0].item()
-
-        batch_results, hms_vis = detector.run_tensor(imgs, trans)
-        img_paths   = [list(in_tuple) for in_tuple in img_paths]
-
-        for ib in batch_results.keys():
-            for ie in batch_results[ib].keys():
-                img_path    = img_paths[ie][ib]
-                preds       = batch_results[ib][ie]
-                det_results[img_path].extend(preds)
-                hm_results[img_path].extend( hms_vis[ib][ie])
-
-    tracker.refresh()
-    result_dict = {}
-    for img_path, preds in det_results.items():
-        result_dict[img_path] = tracker.update(preds)
+    num_forwards = 0
+
+    def batches():
+        nonlocal rescale, num_frames
+        for batch_idx, (imgs, hms, trans, xys_gt, visis_gt, img_paths) in enumerate(tqdm(dataloader, desc='[(CLIP-WISE INFERENCE)]' )):
+            num_frames += imgs.shape[0] * frames_in
+            if rescale < 0:
+                rescale = trans[0][0,0,0].item()
+            yield imgs, trans, [list(in_tuple) for in_tuple in img_paths]
+
+    def write_hms(img_path, hms_vis_):
+        # a frame appears in several windows when step < frames_out
+        stem = osp.splitext(osp.basename(img_path))[0]
+        for hm_vis in hms_vis_:
+            hm_path = osp.join(vis_hm_dir, '{}_{}_s{}.png'.format(stem, hm_counts[img_path], hm_vis['scale']))
+            save_heatmap(hm_path, hm_vis['hm'], image_writer=image_writer)
+        hm_counts[img_path] += 1
+
+    adaptive_stride = cfg['detector']['adaptive_stride']['enabled']
+    roi             = cfg['detector']['roi']['enabled']
+    if adaptive_stride or roi:
+        # the next windows depend on the track so far, so windows are run in short runs
+        result_dict, num_forwards = _track_online(detector, 
+                                                  tracker, 
+                                                  batches(), 
+                                                  cfg['detector']['step'], 
+                                                  stride=AdaptiveStride(cfg) if adaptive_stride else None, 
+                                                  roi_cropper=RoiCropper(cfg) if roi else None, 
+                                                  write_hms=write_hms if keep_hm else None, 
+                                                  max_run=cfg['detector']['adaptive_stride']['max_run'])
+    else:
+        if cfg['detector']['pipeline']['enabled']:
+            batch_outputs = detector.run_tensor_pipelined(batches(), keep_hm=keep_hm)
+        else:
+            batch_outputs = ( (img_paths,) + detector.run_tensor(imgs, trans, keep_hm=keep_hm) for imgs, trans, img_paths in batches() )
+
+        for img_paths, batch_results, hms_vis in batch_outputs:
+            for ib in batch_results.keys():
+                num_forwards += 1
+                for ie in batch_results[ib].keys():
+                    img_path    = img_paths[ie][ib]
+                    preds       = batch_results[ib][ie]
+                    det_results[img_path].extend(preds)
+                    if keep_hm:
+                        write_hms(img_path, hms_vis[ib][ie])
+            del hms_vis
+
+        tracker.refresh()
+        result_dict = {}
+        for img_path, preds in det_results.items():
+            result_dict[img_path] = tracker.update(preds)
     
     t_elapsed = time.time() - t_start
     # +---------------
     log.info('Time:{:.1f}(sec)'.format(t_elapsed))
 
-    # 创建预测结果列表用于保存到CSV
-    csv_predictions = []
-    for img_path, result in result_dict.items():
-        # 从图像路径提取文件名
-        filename = osp.basename(img_path)
-        x_pred = result['x']
-        y_pred = result['y']
-        visi_pred = result['visi']
-        score_pred = result['score']
-        
-        # 将预测结果添加到列表
-        csv_predictions.append({
-            'file name': filename,
-            'x-coordinate': x_pred,
-            'y-coordinate': y_pred,
-            'visibility': 1 if visi_pred else 0,
-            'score': score_pred
-        })
-
     # 保存当前视频片段的CSV文件
-    if match is not None and clip_name is not None and csv_predictions:
+    if match is not None and clip_name is not None and len(result_dict) > 0:
         csv_path = osp.join(osp.dirname(vis_frame_dir) if vis_frame_dir else '.', f'{match}_{clip_name}_predictions.csv')
-        df = pd.DataFrame(csv_predictions)
-        df.to_csv(csv_path, index=False)
+        save_csv_predictions(csv_path, [osp.basename(img_path) for img_path in result_dict.keys()], list(result_dict.values()))
         log.info(f'Predictions for {match}_{clip_name} saved to {csv_path}')
 
     cm_pred = plt.get_cmap('Reds', len(result_dict))
     cm_gt   = plt.get_cmap('Greens', len(result_dict))
 
+    num_extrapolated = len([ res for res in result_dict.values() if res.get('extrapolated', False) ])
+
     fp1_im_list = []
-    cnt = 0
-    for cnt, img_path in enumerate(result_dict.keys()):
-        xy_pred    = (result_dict[img_path]['x'], result_dict[img_path]['y'])
-        x_pred = result_dict[img_path]['x']
-        y_pred = result_dict[img_path]['y']
-        visi_pred  = result_dict[img_path]['visi']
-        score_pred = result_dict[img_path]['score']
-
-        center_gt = None
-        if gt is not None:
-            center_gt = gt[img_path]
-
-        if (gt is not None) and (evaluator_all is not None):
-            evaluator_all.eval_single_frame(xy_pred, visi_pred, score_pred, center_gt.xy, center_gt.is_visible)
-            result = evaluator.eval_single_frame(xy_pred, visi_pred, score_pred, center_gt.xy, center_gt.is_visible)
-            
-            if result['fp1'] > 0 and result['se'] < rescale * dist_thresh:
-                fp1_im_list.append(img_path)
-
-        if vis_frame_dir is not None:
-            vis_frame_path = osp.join(vis_frame_dir, osp.basename(img_path)) if vis_frame_dir is not None else None
-            vis_gt         = cv2.imread(img_path)
-            vis_pred       = cv2.imread(img_path)
-
-            for cnt2, img_path2 in enumerate(result_dict.keys()):
-                if cnt2 > cnt:
-                    break
-
-                x_pred = result_dict[img_path2]['x']
-                y_pred = result_dict[img_path2]['y']
-                visi_pred  = result_dict[img_path2]['visi']
-                score_pred = result_dict[img_path2]['score']
-                
-                # 处理没有真实值数据的情况
-                center_gt = None
-                if gt is not None:
-                    center_gt = gt[img_path2]
-
-                color_pred = (int(cm_pred(cnt2)[2]*255), int(cm_pred(cnt2)[1]*255), int(cm_pred(cnt2)[0]*255))
-                color_gt   = (int(cm_gt(cnt2)[2]*255), int(cm_gt(cnt2)[1]*255), int(cm_gt(cnt2)[0]*255))
-                
-                # 只有在有真实值数据时才绘制真实值
-                if center_gt is not None:
-                    vis_gt = draw_frame(vis_gt, 
-                                center = center_gt, 
-                                color = color_gt,
-                                radius=8)
-
-                vis_pred   = draw_frame(vis_pred, 
-                                    center = Center(is_visible=visi_pred, x=x_pred, y=y_pred), 
-                                    color = color_pred,
-                                    radius=8)
-
-            vis = np.hstack((vis_gt, vis_pred))
-            # 确保目录存在后再保存图像
-            if vis_frame_path:
-                mkdir_if_missing(os.path.dirname(vis_frame_path))
-                success = cv2.imwrite(vis_frame_path, vis)
-                if not success:
-                    log.warning(f'Failed to write image to {vis_frame_path}')
-
-        # if vis_traj_path is not None:
-        #     color_pred = (int(cm_pred(cnt)[2]*255), int(cm_pred(cnt)[1]*255), int(cm_pred(cnt)[0]*255))
-        #     color_gt   = (int(cm_gt(cnt)[2]*255), int(cm_gt(cnt)[1]*255), int(cm_gt(cnt)[0]*255))
-        #     vis        = visualizer.draw_frame(vis, 
-        #                                        center_gt=center_gt, 
-        #                                        color_gt=color_gt,
-        #                 )
-
-    # 检查可视化目录中是否有图像文件，避免gen_video函数出错
-    if vis_frame_dir is not None:
-        if os.path.exists(vis_frame_dir):
-            image_files = [f for f in os.listdir(vis_frame_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff'))]
-            if len(image_files) > 0:
-                video_path = '{}.mp4'.format(vis_frame_dir)
-                gen_video(video_path, vis_frame_dir, fps=25.0)
+    if (gt is not None) and (evaluator_all is not None) and len(result_dict) > 0:
+        img_paths = list(result_dict.keys())
+        if num_extrapolated > 0:
+            if cfg['detector']['adaptive_stride']['detected_only']:
+                img_paths = [ img_path for img_path in img_paths if not result_dict[img_path].get('extrapolated', False) ]
+                log.info('{} extrapolated frames of {} not evaluated'.format(num_extrapolated, len(result_dict)))
             else:
-                log.info(f'No image files found in {vis_frame_dir}, skipping video generation.')
-        else:
-            log.info(f'Visualization directory {vis_frame_dir} does not exist, skipping video generation.')
+                log.info('{} extrapolated frames of {} evaluated, not ranked for AP'.format(num_extrapolated, len(result_dict)))
+        results   = [ result_dict[img_path] for img_path in img_paths ]
+        # positions of extrapolated frames are scored, but their scores are not computed by the detector
+        result    = evaluator.eval_clip([ (res['x'], res['y']) for res in results ],
+                                        [ res['visi'] for res in results ],
+                                        [ res['score'] for res in results ],
+                                        [ gt[img_path].xy for img_path in img_paths ],
+                                        [ gt[img_path].is_visible for img_path in img_paths ],
+                                        ranked=[ not res.get('extrapolated', False) for res in results ])
+        evaluator_all += evaluator
+        fp1_inds    = np.flatnonzero( result['fp1'] & (result['se'] < rescale * dist_thresh) )
+        fp1_im_list = [ img_paths[ind] for ind in fp1_inds ]
+
+    if vis_frame_dir is not None and len(result_dict) > 0:
+        # trajectories are kept on persistent canvases, so each frame is read, composited and encoded once
+        overlay_gt   = TrajectoryOverlay(radius=8)
+        overlay_pred = TrajectoryOverlay(radius=8)
+        video_path   = '{}.mp4'.format(vis_frame_dir)
+        video_writer = None
+        for cnt, img_path in enumerate(tqdm(result_dict.keys(), desc='[(VISUALIZATION)]')):
+            vis_pred = cv2.imread(img_path)
+            if vis_pred is None:
+                log.warning('Failed to read image {}'.format(img_path))
+                continue
+            vis_gt   = vis_pred.copy()
+
+            color_pred = (int(cm_pred(cnt)[2]*255), int(cm_pred(cnt)[1]*255), int(cm_pred(cnt)[0]*255))
+            color_gt   = (int(cm_gt(cnt)[2]*255), int(cm_gt(cnt)[1]*255), int(cm_gt(cnt)[0]*255))
+            # 只有在有真实值数据时才绘制真实值
+            if gt is not None:
+                overlay_gt.add(gt[img_path], color_gt, vis_gt.shape)
+            result = result_dict[img_path]
+            overlay_pred.add(Center(is_visible=result['visi'], x=result['x'], y=result['y']), color_pred, vis_pred.shape)
+
+            vis = np.hstack((overlay_gt.composite(vis_gt), overlay_pred.composite(vis_pred)))
+            if video_writer is None:
+                video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), 25.0, (vis.shape[1], vis.shape[0]))
+            video_writer.write(vis)
+            if vis_save_frames:
+                image_writer.write(osp.join(vis_frame_dir, osp.basename(img_path)), vis)
+        if video_writer is not None:
+            video_writer.release()
+
+    if image_writer is not None:
+        image_writer.close()
 
     if evaluator is not None:
         evaluator.print_results(with_ap=False)
 
-    return fp1_im_list, {'t_elapsed': t_elapsed, 'num_frames': num_frames}
+    return fp1_im_list, {'t_elapsed': t_elapsed, 'num_frames': num_frames, 'num_forwards': num_forwards, 'num_extrapolated': num_extrapolated}
+
+# detector and tracker of a shard worker process
+_shard_state = {}
+
+def _shard_loader_cfg(cfg, num_shards):
+    '''
+    each shard loads its clips with its own loader workers, so inference_video_num_workers is split among the shards
+    '''
+    cfg = copy.deepcopy(apply_tuned_settings(cfg))
+    num_workers = cfg['dataloader']['inference_video_num_workers']
+    if num_workers > 0:
+        cfg['dataloader']['inference_video_num_workers'] = max(1, num_workers // num_shards)
+    # already applied before splitting
+    cfg['dataloader']['tuning']['auto_apply'] = False
+    log.info('{} shards x {} loader workers (inference_video_num_workers={})'.format(num_shards, cfg['dataloader']['inference_video_num_workers'], num_workers))
+    return cfg
+
+def _init_shard_worker(cfg, worker_ids):
+    worker_id = worker_ids.get()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s][%(name)s][%(levelname)s] - shard {}: %(message)s'.format(worker_id))
+    if cfg['runner']['device']=='cuda':
+        gpus = cfg['runner']['gpus']
+        gpu  = gpus[worker_id % len(gpus)]
+        torch.cuda.set_device(gpu)
+        cfg['runner']['gpus'] = [gpu]
+    _shard_state['cfg']      = cfg
+    _shard_state['detector'] = build_detector(cfg)
+    _shard_state['tracker']  = build_tracker(cfg)
+
+def _run_shard_clip(key, dataloader_and_gt, vis_frame_dir, vis_hm_dir, vis_traj_path):
+    cfg       = _shard_state['cfg']
+    evaluator = Evaluator(cfg)
+    match, clip_name = key
+    fp1_im_list, tmp = inference_video(_shard_state['detector'], 
+                                       _shard_state['tracker'], 
+                                       dataloader_and_gt['clip_loader'], 
+                                       cfg,
+                                       vis_frame_dir=vis_frame_dir, 
+                                       vis_save_frames=cfg['runner']['vis_save_frames'],
+                                       vis_hm_dir=vis_hm_dir, 
+                                       vis_traj_path=vis_traj_path,
+                                       evaluator_all=evaluator, 
+                                       gt=dataloader_and_gt['clip_gt'],
+                                       match=match,
+                                       clip_name=clip_name)
+    return fp1_im_list, tmp, evaluator
 
 class VideosInferenceRunner(BaseRunner):
     def __init__(self,
@@ -210,29 +339,55 @@ class VideosInferenceRunner(BaseRunner):
         if vis_hm is not None:
             self._vis_hm = vis_hm
         self._vis_traj = cfg['runner']['vis_traj']
+        self._vis_save_frames = cfg['runner']['vis_save_frames']
+        self._num_shards = cfg['runner']['num_shards']
 
         if clip_loaders_and_gts is None:
+            loader_cfg = cfg
+            if self._num_shards > 1:
+                loader_cfg = _shard_loader_cfg(cfg, self._num_shards)
             split = cfg['runner']['split']
             if split=='train':
-                _, _, self._clip_loaders_and_gts, _ = build_dataloader(cfg)
+                _, _, self._clip_loaders_and_gts, _ = build_dataloader(loader_cfg)
             elif split=='test':
-                _, _, _, self._clip_loaders_and_gts = build_dataloader(cfg)
+                _, _, _, self._clip_loaders_and_gts = build_dataloader(loader_cfg)
             else:
                 raise ValueError('unknown split: {}'.format(split))
         else:
             self._clip_loaders_and_gts = clip_loaders_and_gts
 
     def run(self, model=None, model_dir=None):
-        return self._run_model()
+        return self._run_model(model=model)
+
+    def _get_vis_paths(self, match, clip_name):
+        vis_frame_dir, vis_hm_dir, vis_traj_path = None, None, None
+        if self._vis_result:
+            vis_frame_dir = osp.join(self._output_dir, '{}_{}'.format(match, clip_name) )
+            mkdir_if_missing(vis_frame_dir)
+        if self._vis_hm:
+            vis_hm_dir = osp.join(self._output_dir, '{}_{}'.format(match, clip_name), 'hm')
+            mkdir_if_missing(vis_hm_dir)
+        if self._vis_traj:
+            vis_traj_dir = osp.join(self._output_dir, 'vis_traj')
+            mkdir_if_missing(vis_traj_dir)
+            vis_traj_path = osp.join(vis_traj_dir, '{}_{}.png'.format(match, clip_name))
+        return vis_frame_dir, vis_hm_dir, vis_traj_path
 
     def _run_model(self, model=None):
+        if self._num_shards > 1:
+            if model is None:
+                return self._run_model_sharded()
+            log.info('a model instance cannot be shared with shard workers, so clips are processed serially')
+
         #evaluator = build_evaluator(self._cfg)
         evaluator = Evaluator(self._cfg)
         detector  = build_detector(self._cfg, model=model)
         tracker   = build_tracker(self._cfg)
 
+        t_start       = time.time()
         t_elapsed_all = 0.
         num_frames_all   = 0
+        num_extrapolated_all = 0
         fp1_im_list_dict = {}
         
         for key, dataloader_and_gt in self._clip_loaders_and_gts.items():
@@ -240,17 +395,7 @@ class VideosInferenceRunner(BaseRunner):
             dataloader = dataloader_and_gt['clip_loader']
             gt_dict    = dataloader_and_gt['clip_gt']
 
-            vis_frame_dir, vis_hm_dir, vis_traj_path = None, None, None
-            if self._vis_result:
-                vis_frame_dir = osp.join(self._output_dir, '{}_{}'.format(match, clip_name) )
-                mkdir_if_missing(vis_frame_dir)
-            if self._vis_hm:
-                vis_hm_dir = osp.join(self._output_dir, '{}_{}'.format(match, clip_name), 'hm')
-                mkdir_if_missing(vis_hm_dir)
-            if self._vis_traj:
-                vis_traj_dir = osp.join(self._output_dir, 'vis_traj')
-                mkdir_if_missing(vis_traj_dir)
-                vis_traj_path = osp.join(vis_traj_dir, '{}_{}.png'.format(match, clip_name))
+            vis_frame_dir, vis_hm_dir, vis_traj_path = self._get_vis_paths(match, clip_name)
 
             log.info('eval @ match={}, clip={}'.format(match, clip_name))
 
@@ -259,6 +404,7 @@ class VideosInferenceRunner(BaseRunner):
                             dataloader, 
                             self._cfg,
                             vis_frame_dir=vis_frame_dir, 
+                            vis_save_frames=self._vis_save_frames,
                             vis_hm_dir=vis_hm_dir, 
                             vis_traj_path=vis_traj_path,
                             evaluator_all=evaluator, 
@@ -269,15 +415,69 @@ class VideosInferenceRunner(BaseRunner):
             
             t_elapsed_all += tmp['t_elapsed']
             num_frames_all += tmp['num_frames']
+            num_extrapolated_all += tmp['num_extrapolated']
+
+        return self._summarize(evaluator, t_elapsed_all, num_frames_all, fp1_im_list_dict, time.time() - t_start, num_extrapolated_all)
+
+    def _run_model_sharded(self):
+        cfg = copy.deepcopy(self._cfg)
+        if cfg['detector']['model_path'] is None:
+            # hydra config is not available in the worker processes
+            cfg['detector']['model_path'] = osp.join(HydraConfig.get().run.dir, 'best_model.pth.tar')
+
+        # longest clips are submitted first to limit stragglers
+        keys = sorted(self._clip_loaders_and_gts.keys(), key=lambda key: len(self._clip_loaders_and_gts[key]['clip_loader'].dataset), reverse=True)
+        log.info('eval {} clips with {} shards'.format(len(keys), self._num_shards))
+
+        t_start    = time.time()
+        ctx        = mp.get_context('spawn')
+        worker_ids = ctx.Queue()
+        for worker_id in range(self._num_shards):
+            worker_ids.put(worker_id)
+        clip_outputs = {}
+        with ProcessPoolExecutor(max_workers=self._num_shards, mp_context=ctx, initializer=_init_shard_worker, initargs=(cfg, worker_ids)) as executor:
+            futures = {}
+            for key in keys:
+                future = executor.submit(_run_shard_clip, key, self._clip_loaders_and_gts[key], *self._get_vis_paths(*key))
+                futures[future] = key
+            for future in as_completed(futures):
+                key = futures[future]
+                clip_outputs[key] = future.result()
+                log.info('done @ match={}, clip={} ({}/{})'.format(key[0], key[1], len(clip_outputs), len(keys)))
+        t_wall = time.time() - t_start
+
+        # merged in the serial order so that the results are identical to a serial run
+        evaluator        = Evaluator(self._cfg)
+        t_elapsed_all    = 0.
+        num_frames_all   = 0
+        num_extrapolated_all = 0
+        fp1_im_list_dict = {}
+        for key in self._clip_loaders_and_gts.keys():
+            fp1_im_list, tmp, clip_evaluator = clip_outputs[key]
+            evaluator += clip_evaluator
+            fp1_im_list_dict[key] = fp1_im_list
+            # FPS is per clip as in a serial run, the parallel speedup shows in t_wall
+            t_elapsed_all  += tmp['t_elapsed']
+            num_frames_all += tmp['num_frames']
+            num_extrapolated_all += tmp['num_extrapolated']
+
+        return self._summarize(evaluator, t_elapsed_all, num_frames_all, fp1_im_list_dict, t_wall, num_extrapolated_all)
 
+    def _summarize(self, evaluator, t_elapsed_all, num_frames_all, fp1_im_list_dict, t_wall, num_extrapolated_all=0):
         log.info('-- TOTAL --')
         evaluator.print_results(txt='{} @ dist_threshold={}'.format(self._cfg['model']['name'], evaluator.dist_threshold), 
                                 elapsed_time=t_elapsed_all, 
                                 num_frames=num_frames_all)
+        log.info('Wall-clock time: {:.1f}(sec)'.format(t_wall))
+        if num_extrapolated_all > 0:
+            log.info('Extrapolated frames: {} ({})'.format(num_extrapolated_all, 'not evaluated' if self._cfg['detector']['adaptive_stride']['detected_only'] else 'evaluated, not ranked for AP'))
 
         return {'prec': evaluator.prec, 
                 'recall': evaluator.recall, 
                 'f1': evaluator.f1, 
                 'accuracy': evaluator.accuracy, 
                 'rmse': evaluator.rmse, 
+                't_elapsed': t_elapsed_all, 
+                't_wall': t_wall, 
+                'num_extrapolated': num_extrapolated_all, 
                 'fp1_im_list_dict': fp1_im_list_dict}
\ No newline at end of file
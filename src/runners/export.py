@@ -0,0 +1,102 @@
+import os.path as osp
+import inspect
+import logging
+from omegaconf import DictConfig
+import numpy as np
+import torch
+from torch import nn
+
+from models import build_model
+from detectors import OnnxModel
+from utils import mkdir_if_missing
+
+from .base import BaseRunner
+
+log = logging.getLogger(__name__)
+
+class OnnxExportWrapper(nn.Module):
+    '''
+    returns the outputs of a model as a tuple ordered by out_scales, since onnx graphs cannot output dicts
+    '''
+    def __init__(self, model, out_scales):
+        super().__init__()
+        self._model      = model
+        self._out_scales = list(out_scales)
+
+    def forward(self, x):
+        outputs = self._model(x)
+        return tuple([ outputs[scale] for scale in self._out_scales ])
+
+def export_onnx(model, cfg, onnx_path, opset_version=13):
+    frames_in  = cfg['model']['frames_in']
+    inp_w, inp_h = cfg['model']['inp_width'], cfg['model']['inp_height']
+    out_scales = cfg['model']['out_scales']
+
+    wrapper      = OnnxExportWrapper(model, out_scales).eval()
+    dummy        = torch.randn(1, frames_in*3, inp_h, inp_w)
+    output_names = [ 'hm_{}'.format(scale) for scale in out_scales ]
+    # spatial axes are dynamic for the crops of detector.roi
+    dynamic_axes = {'imgs': {0: 'batch', 2: 'height', 3: 'width'}}
+    for scale, output_name in zip(out_scales, output_names):
+        dynamic_axes[output_name] = {0: 'batch', 2: 'height_{}'.format(scale), 3: 'width_{}'.format(scale)}
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # dynamic_axes is handled by the torchscript-based exporter
+        export_kwargs['dynamo'] = False
+    mkdir_if_missing(osp.dirname(osp.abspath(onnx_path)))
+    with torch.no_grad():
+        torch.onnx.export(wrapper,
+                          dummy,
+                          onnx_path,
+                          input_names=['imgs'],
+                          output_names=output_names,
+                          dynamic_axes=dynamic_axes,
+                          opset_version=opset_version,
+                          **export_kwargs)
+    log.info('{} exported to {}'.format(cfg['model']['name'], onnx_path))
+
+@torch.no_grad()
+def check_onnx_parity(model, onnx_model, cfg, batch_size=2, input_wh=None):
+    '''
+    max abs difference of the outputs of onnxruntime and eager pytorch for each scale
+    '''
+    frames_in  = cfg['model']['frames_in']
+    inp_w, inp_h = (cfg['model']['inp_width'], cfg['model']['inp_height']) if input_wh is None else input_wh
+    imgs       = torch.randn(batch_size, frames_in*3, inp_h, inp_w)
+    preds      = model(imgs)
+    preds_onnx = onnx_model(imgs)
+    max_diffs  = {}
+    for scale in cfg['model']['out_scales']:
+        max_diffs[scale] = (preds[scale] - preds_onnx[scale]).abs().max().item()
+    return max_diffs
+
+class ExportRunner(BaseRunner):
+    def __init__(self,
+                 cfg: DictConfig,
+    ):
+        super().__init__(cfg)
+        self._model_path    = cfg['detector']['model_path']
+        self._onnx_path     = cfg['runner']['onnx_path']
+        self._opset_version = cfg['runner']['opset_version']
+        self._parity_atol   = cfg['runner']['parity_atol']
+        if self._model_path is None:
+            raise ValueError('detector.model_path is mandatory')
+        if self._onnx_path is None:
+            model_name      = osp.basename(self._model_path).split('.')[0]
+            self._onnx_path = osp.join(self._output_dir, '{}.onnx'.format(model_name))
+
+    def run(self):
+        model      = build_model(self._cfg)
+        checkpoint = torch.load(self._model_path, map_location='cpu')
+        model.load_state_dict(checkpoint['model_state_dict'])
+        model.eval()
+
+        export_onnx(model, self._cfg, self._onnx_path, opset_version=self._opset_version)
+
+        onnx_model = OnnxModel(self._onnx_path, self._cfg['model']['out_scales'], device='cpu')
+        for input_wh in [None, tuple(self._cfg['detector']['roi']['inp_wh'])]:
+            max_diffs = check_onnx_parity(model, onnx_model, self._cfg, input_wh=input_wh)
+            for scale, max_diff in max_diffs.items():
+                log.info('parity @ scale={}, input={}: max abs diff={:.2e}'.format(scale, 'full' if input_wh is None else 'roi', max_diff))
+                if max_diff > self._parity_atol:
+                    raise RuntimeError('onnx outputs differ from pytorch: {:.2e} > {:.2e}'.format(max_diff, self._parity_atol))
@@ -5,7 +5,7 @@ from omegaconf import DictConfig
 import cv2
 
 from .base import BaseRunner
-from utils import mkdir_if_missing
+from utils import mkdir_if_missing, build_image_writer
 
 log = logging.getLogger(__name__)
 
@@ -36,14 +36,15 @@ def extract_frame_badminton(cfg):
             if not cap.isOpened():
                 assert 0, '{} cannot opened'.format(video_path)
             cnt = 0
-            while True:
-                ret, frame = cap.read()
-                if ret:
-                    frame_path = osp.join(frame_dir, '{:05d}.png'.format(cnt))
-                    cv2.imwrite(frame_path, frame)
-                    cnt+=1
-                else:
-                    break
+            with build_image_writer(cfg) as image_writer:
+                while True:
+                    ret, frame = cap.read()
+                    if ret:
+                        frame_path = osp.join(frame_dir, '{:05d}.png'.format(cnt))
+                        image_writer.write(frame_path, frame)
+                        cnt+=1
+                    else:
+                        break
 
 def extract_frame_soccer(cfg: DictConfig):
     root_dir      = cfg['dataset']['root_dir']
@@ -70,13 +71,14 @@ def extract_frame_soccer(cfg: DictConfig):
         if not cap.isOpened():
             assert 0, '{} cannot opened'.format(video_path)
         cnt = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_path = osp.join(frame_dir, '{:05d}{}'.format(cnt, img_ext))
-            cv2.imwrite(frame_path, frame)
-            cnt+=1
+        with build_image_writer(cfg) as image_writer:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_path = osp.join(frame_dir, '{:05d}{}'.format(cnt, img_ext))
+                image_writer.write(frame_path, frame)
+                cnt+=1
 
 def extract_frame(cfg: DictConfig):
     dataset_name = cfg['dataset']['name']
@@ -0,0 +1,256 @@
+import os
+import os.path as osp
+import time
+import queue
+import threading
+import logging
+from collections import OrderedDict, deque
+from tqdm import tqdm
+from omegaconf import DictConfig
+import numpy as np
+import torch
+import cv2
+
+from dataloaders import get_transform, build_img_transforms
+from detectors import build_detector
+from trackers import build_tracker
+from utils import mkdir_if_missing, save_csv_predictions
+
+from .base import BaseRunner
+
+log = logging.getLogger(__name__)
+
+class FrameDecoder(threading.Thread):
+    '''
+    decodes a video once and pushes preprocessed frames to a bounded queue
+    '''
+    def __init__(self, video_path, input_wh, transform, queue_size=64):
+        super().__init__(daemon=True)
+        self._video_path = video_path
+        self._input_wh   = input_wh
+        self._transform  = transform
+        self._queue      = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+
+        self._trans_input = None
+        self._frame_hw    = None
+        self._num_frames  = 0
+        self._t_decode    = 0.
+        self._error       = None
+
+        cap = cv2.VideoCapture(self._video_path)
+        if not cap.isOpened():
+            raise IOError('{} cannot be opened'.format(self._video_path))
+        self._total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+    def run(self):
+        cap = cv2.VideoCapture(self._video_path)
+        try:
+            fid = 0
+            while not self._stop_event.is_set():
+                t_start = time.time()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if self._trans_input is None:
+                    self._frame_hw    = frame.shape[:2]
+                    self._trans_input = get_transform(frame, self._input_wh)
+                img   = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                img   = cv2.warpAffine(img, self._trans_input, self._input_wh, flags=cv2.INTER_LINEAR)
+                img_t = self._transform(img)
+                self._t_decode   += time.time() - t_start
+                self._num_frames += 1
+                self._queue.put((fid, img_t))
+                fid += 1
+        except Exception as e:
+            self._error = e
+        finally:
+            cap.release()
+            self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._stop_event.set()
+        # drain the queue so that a blocked producer can finish
+        while self.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    @property
+    def frame_hw(self):
+        return self._frame_hw
+
+    @property
+    def total_frames(self):
+        return self._total_frames
+
+    @property
+    def num_frames(self):
+        return self._num_frames
+
+    @property
+    def t_decode(self):
+        return self._t_decode
+
+def get_output_transforms(frame_hw, output_wh, out_scales):
+    h, w      = frame_hw
+    dummy     = np.empty((h, w, 3), dtype=np.uint8)
+    trans_inv = {}
+    out_w, out_h = output_wh
+    for scale in out_scales:
+        trans_inv[scale] = get_transform(dummy, (out_w, out_h), inv=1)
+        out_w = out_w // 2
+        out_h = out_h // 2
+    return trans_inv
+
+@torch.no_grad()
+def inference_video_file(detector,
+                         tracker,
+                         video_path,
+                         cfg,
+                         batch_size=8,
+                         queue_size=64,
+):
+    frames_in  = detector.frames_in
+    frames_out = detector.frames_out
+    step       = cfg['detector']['step']
+    rgb_diff   = cfg['model']['rgb_diff']
+    output_wh  = (cfg['model']['out_width'], cfg['model']['out_height'])
+    out_scales = cfg['model']['out_scales']
+    _, transform = build_img_transforms(cfg)
+
+    decoder = FrameDecoder(video_path, detector.input_wh, transform, queue_size=queue_size)
+
+    # +---------------
+    t_start = time.time()
+    decoder.start()
+
+    tracker.refresh()
+    frames      = deque(maxlen=frames_in)
+    windows     = []
+    det_results = OrderedDict()
+    results     = []
+    trans_inv   = None
+    t_infer     = 0.
+    num_windows = 0
+
+    def run_batch(windows):
+        imgs = torch.stack([ imgs_t for _, imgs_t in windows ], dim=0)
+        affine_mats = {}
+        for scale, mat in trans_inv.items():
+            affine_mats[scale] = torch.from_numpy(np.stack([mat]*len(windows), axis=0))
+        batch_results, _ = detector.run_tensor(imgs, affine_mats)
+        for ib, (start_fid, _) in enumerate(windows):
+            for ie in range(frames_out):
+                fid = start_fid + frames_in - frames_out + ie
+                if fid not in det_results.keys():
+                    det_results[fid] = []
+                det_results[fid].extend(batch_results[ib][ie])
+
+    def flush(until_fid):
+        while len(det_results) > 0:
+            fid = next(iter(det_results))
+            if fid >= until_fid:
+                break
+            results.append((fid, tracker.update(det_results.pop(fid))))
+
+    try:
+        for fid, img_t in tqdm(decoder, total=decoder.total_frames, desc='[(VIDEO INFERENCE)]'):
+            frames.append(img_t)
+            start_fid = fid - frames_in + 1
+            if start_fid < 0 or start_fid % step != 0:
+                continue
+
+            if trans_inv is None:
+                trans_inv = get_output_transforms(decoder.frame_hw, output_wh, out_scales)
+            imgs_t = list(frames)
+            if rgb_diff:
+                imgs_t[0] = torch.abs(imgs_t[1] - imgs_t[0])
+            windows.append((start_fid, torch.cat(imgs_t, dim=0)))
+            if len(windows) < batch_size:
+                continue
+
+            t_batch = time.time()
+            run_batch(windows)
+            t_infer += time.time() - t_batch
+            num_windows += len(windows)
+            # frames before the first output frame of the next window are complete
+            flush(windows[-1][0] + step + frames_in - frames_out)
+            windows = []
+
+        if len(windows) > 0:
+            t_batch = time.time()
+            run_batch(windows)
+            t_infer += time.time() - t_batch
+            num_windows += len(windows)
+        flush(np.inf)
+    finally:
+        decoder.stop()
+
+    t_elapsed = time.time() - t_start
+    # +---------------
+
+    num_frames = decoder.num_frames
+    if num_frames > 0 and decoder.t_decode > 0:
+        log.info('Decode: {} frames in {:.1f}(sec), FPS: {:.1f}'.format(num_frames, decoder.t_decode, num_frames/decoder.t_decode))
+    # overlapping windows (step < frames_in) share frames, so each output frame is counted once
+    num_out_frames = len(results)
+    if num_windows > 0 and t_infer > 0:
+        log.info('Inference: {} windows ({} frames) in {:.1f}(sec), FPS: {:.1f}'.format(num_windows, num_out_frames, t_infer, num_out_frames/t_infer))
+    log.info('Time:{:.1f}(sec)'.format(t_elapsed))
+
+    return results, {'t_elapsed': t_elapsed, 't_decode': decoder.t_decode, 't_infer': t_infer, 'num_frames': num_frames}
+
+class VideoFileInferenceRunner(BaseRunner):
+    def __init__(self,
+                 cfg: DictConfig,
+    ):
+        super().__init__(cfg)
+
+        video_path = cfg['runner']['video_path']
+        if video_path is None:
+            raise ValueError('runner.video_path is mandatory')
+        if osp.isdir(video_path):
+            video_exts = tuple([ ext.lower() for ext in cfg['runner']['video_exts'] ])
+            video_names = [ video_name for video_name in os.listdir(video_path) if video_name.lower().endswith(video_exts) ]
+            video_names.sort()
+            self._video_paths = [ osp.join(video_path, video_name) for video_name in video_names ]
+        elif osp.isfile(video_path):
+            self._video_paths = [video_path]
+        else:
+            raise FileNotFoundError('{} not found'.format(video_path))
+
+        self._batch_size = cfg['runner']['batch_size']
+        self._queue_size = cfg['runner']['queue_size']
+
+    def run(self):
+        detector = build_detector(self._cfg)
+        tracker  = build_tracker(self._cfg)
+
+        mkdir_if_missing(self._output_dir)
+        for video_path in self._video_paths:
+            log.info('inference @ video={}'.format(video_path))
+            results, _ = inference_video_file(detector,
+                                              tracker,
+                                              video_path,
+                                              self._cfg,
+                                              batch_size=self._batch_size,
+                                              queue_size=self._queue_size)
+
+            video_name = osp.splitext(osp.basename(video_path))[0]
+            csv_path   = osp.join(self._output_dir, '{}_predictions.csv'.format(video_name))
+            save_csv_predictions(csv_path,
+                                 [ '{:05d}.png'.format(fid) for fid, _ in results ],
+                                 [ result for _, result in results ])
+            log.info('Predictions for {} saved to {}'.format(video_name, csv_path))
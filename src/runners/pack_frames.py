@@ -0,0 +1,94 @@
+import os
+import os.path as osp
+import copy
+import json
+import logging
+from collections import OrderedDict
+from tqdm import tqdm
+from omegaconf import DictConfig
+import numpy as np
+import cv2
+
+from datasets import select_dataset
+from dataloaders import read_image, get_transform
+from dataloaders.frame_store import frame_store_name, parse_frame_id
+from utils import mkdir_if_missing
+
+from .base import BaseRunner
+
+log = logging.getLogger(__name__)
+
+def pack_clip(frame_paths, input_wh, store_dir, name):
+    '''
+    writes the frames warped to input_wh to <name>.npy and the index to <name>.json
+    '''
+    npy_path   = osp.join(store_dir, '{}.npy'.format(name))
+    index_path = osp.join(store_dir, '{}.json'.format(name))
+
+    frames      = None
+    orig_hw     = None
+    trans_input = None
+    for i, frame_path in enumerate(tqdm(frame_paths, desc='[(PACK)]')):
+        img = np.array(read_image(frame_path))
+        if frames is None:
+            orig_hw     = img.shape[:2]
+            trans_input = get_transform(img, input_wh)
+            frames      = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.uint8, shape=(len(frame_paths), input_wh[1], input_wh[0], 3))
+        if img.shape[:2]!=orig_hw:
+            raise ValueError('frames of different sizes in {}: {} and {}'.format(osp.dirname(frame_path), orig_hw, img.shape[:2]))
+        frames[i] = cv2.warpAffine(img, trans_input, input_wh, flags=cv2.INTER_LINEAR)
+    frames.flush()
+    del frames
+
+    frame_names = [ osp.basename(frame_path) for frame_path in frame_paths ]
+    index = {'clip_dir': osp.abspath(osp.dirname(frame_paths[0])), 
+             'input_wh': list(input_wh), 
+             'orig_hw': list(orig_hw), 
+             'trans_input': trans_input.tolist(), 
+             'frame_names': frame_names, 
+             'frame_ids': [ parse_frame_id(frame_name) for frame_name in frame_names ]}
+    # the index is written last, so that a clip is used only when it is completely packed
+    tmp_path = '{}.tmp'.format(index_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+class PackFramesRunner(BaseRunner):
+    def __init__(self,
+                 cfg: DictConfig,
+    ):
+        super().__init__(cfg)
+        self._store_dir = cfg['dataloader']['frame_store']['root_dir']
+        self._splits    = cfg['runner']['splits']
+        self._overwrite = cfg['runner']['overwrite']
+        self._input_wh  = (cfg['model']['inp_width'], cfg['model']['inp_height'])
+        if self._store_dir is None:
+            raise ValueError('dataloader.frame_store.root_dir is mandatory')
+
+    def _collect_clip_frames(self):
+        # frames used by any window, grouped by clip directory in the order of windows
+        cfg = copy.deepcopy(self._cfg)
+        for split in ['train', 'test']:
+            cfg['dataloader'][split]           = split in self._splits
+            cfg['dataloader'][split + '_clip'] = False
+        dataset = select_dataset(cfg)
+
+        clip_frames = OrderedDict()
+        for split in self._splits:
+            seq_list = dataset.train if split=='train' else dataset.test
+            for seq in seq_list:
+                for img_path in seq['frames']:
+                    clip_frames.setdefault(osp.dirname(img_path), OrderedDict())[img_path] = None
+        return clip_frames
+
+    def run(self):
+        mkdir_if_missing(self._store_dir)
+        clip_frames = self._collect_clip_frames()
+        for clip_dir, frame_paths in clip_frames.items():
+            name = frame_store_name(clip_dir, self._input_wh)
+            if osp.exists(osp.join(self._store_dir, '{}.json'.format(name))) and not self._overwrite:
+                log.info('{} already packed. skip'.format(clip_dir))
+                continue
+            frame_paths = sorted(frame_paths.keys(), key=lambda frame_path: parse_frame_id(osp.basename(frame_path)))
+            log.info('pack {} frames in {} to {}'.format(len(frame_paths), clip_dir, osp.join(self._store_dir, name)))
+            pack_clip(frame_paths, self._input_wh, self._store_dir, name)
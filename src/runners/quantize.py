@@ -0,0 +1,95 @@
+import os.path as osp
+import math
+import logging
+from omegaconf import DictConfig
+import torch
+
+from dataloaders import build_dataloader, build_batch_transform
+from models import build_model
+from models.quantization import QUANTIZABLE_MODELS, resolve_backend, prepare_quantization, convert_quantization
+from utils import save_checkpoint
+
+from .base import BaseRunner
+from .eval import VideosInferenceRunner
+from .runner_utils import log_drift
+
+log = logging.getLogger(__name__)
+
+@torch.no_grad()
+def calibrate(prepared_model, clip_loaders_and_gts, num_windows, batch_transform=None):
+    '''
+    feeds up to num_windows windows, spread over the clips, to the observers
+    '''
+    num_windows_per_clip = max(1, math.ceil(num_windows / max(1, len(clip_loaders_and_gts))))
+    cnt = 0
+    for key, dataloader_and_gt in clip_loaders_and_gts.items():
+        cnt_clip = 0
+        for imgs, _, _, _, _, _ in dataloader_and_gt['clip_loader']:
+            imgs = imgs[:min(num_windows_per_clip-cnt_clip, num_windows-cnt)]
+            if batch_transform is not None:
+                imgs = batch_transform(imgs)
+            prepared_model(imgs)
+            cnt_clip += imgs.shape[0]
+            cnt      += imgs.shape[0]
+            if cnt_clip >= num_windows_per_clip or cnt >= num_windows:
+                break
+        if cnt >= num_windows:
+            break
+    return cnt
+
+class QuantizeRunner(BaseRunner):
+    def __init__(self,
+                 cfg: DictConfig,
+    ):
+        super().__init__(cfg)
+        self._model_path    = cfg['detector']['model_path']
+        self._backend       = cfg['runner']['quantization']['backend']
+        self._num_windows   = cfg['runner']['quantization']['num_calib_windows']
+        self._eval_drift    = cfg['runner']['quantization']['eval_drift']
+        self._quantized_path = cfg['runner']['quantization']['quantized_path']
+        if self._model_path is None:
+            raise ValueError('detector.model_path is mandatory')
+        if cfg['model']['name'] not in QUANTIZABLE_MODELS:
+            raise ValueError('quantization is not supported for model: {}'.format(cfg['model']['name']))
+        if cfg['runner']['device']!='cpu':
+            raise ValueError('quantized models run on cpu only')
+        if self._quantized_path is None:
+            model_name = osp.basename(self._model_path).split('.')[0]
+            self._quantized_path = osp.join(self._output_dir, '{}_int8.pth.tar'.format(model_name))
+
+        split = cfg['runner']['split']
+        if split=='train':
+            _, _, self._clip_loaders_and_gts, _ = build_dataloader(cfg)
+        elif split=='test':
+            _, _, _, self._clip_loaders_and_gts = build_dataloader(cfg)
+        else:
+            raise ValueError('unknown split: {}'.format(split))
+
+    def run(self):
+        # the checkpoint records the engine actually used
+        self._backend = resolve_backend(self._backend)
+        model      = build_model(self._cfg)
+        checkpoint = torch.load(self._model_path, map_location='cpu')
+        model.load_state_dict(checkpoint['model_state_dict'])
+        model.eval()
+
+        frames_in      = self._cfg['model']['frames_in']
+        example_inputs = (torch.randn(1, frames_in*3, self._cfg['model']['inp_height'], self._cfg['model']['inp_width']),)
+        prepared_model = prepare_quantization(model, example_inputs, backend=self._backend)
+        num_windows    = calibrate(prepared_model, self._clip_loaders_and_gts, self._num_windows, batch_transform=build_batch_transform(self._cfg))
+        log.info('calibrated with {} windows'.format(num_windows))
+        quantized_model = convert_quantization(prepared_model)
+
+        save_checkpoint({'model_state_dict': quantized_model.state_dict(),
+                         'quantization': {'backend': self._backend, 'num_calib_windows': num_windows},
+                         'fp32_model_path': self._model_path,
+                         }, False, self._quantized_path)
+        log.info('quantized model saved to {}'.format(self._quantized_path))
+
+        if self._eval_drift:
+            runner = VideosInferenceRunner(self._cfg, clip_loaders_and_gts=self._clip_loaders_and_gts)
+            log.info('-- FP32 --')
+            results_fp32 = runner.run(model=model)
+            log.info('-- INT8 --')
+            results_int8 = runner.run(model=quantized_model)
+            log_drift(results_fp32, results_int8, txt='INT8 vs FP32 ({})'.format(self._cfg['model']['name']))
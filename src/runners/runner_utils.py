@@ -14,11 +14,15 @@ from utils import save_checkpoint, AverageMeter
 
 log = logging.getLogger(__name__)
 
-def train_epoch(epoch, model, train_loader, loss_criterion, optimizer, device):
+def train_epoch(epoch, model, train_loader, loss_criterion, optimizer, device, batch_transform=None):
     batch_loss = AverageMeter()
     model.train()
     t_start = time.time()
-    for batch_idx, (imgs, hms) in enumerate(tqdm(train_loader, desc='[(TRAIN) Epoch {}]'.format(epoch)) ):
+    for batch_idx, batch in enumerate(tqdm(train_loader, desc='[(TRAIN) Epoch {}]'.format(epoch)) ):
+        imgs, hms = batch[0], batch[1]
+        if batch_transform is not None:
+            # uint8 windows and their color jitter factors (dataloader.uint8_frames)
+            imgs = batch_transform(imgs.to(device), jitter=batch[2])
 
         for scale, hm in hms.items():
             hms[scale] = hm.to(device)
@@ -37,7 +41,7 @@ def train_epoch(epoch, model, train_loader, loss_criterion, optimizer, device):
     return {'epoch':epoch, 'loss':batch_loss.avg}
 
 @torch.no_grad()
-def test_epoch(epoch, model, dataloader, loss_criterion, device, cfg, vis_dir=None):
+def test_epoch(epoch, model, dataloader, loss_criterion, device, cfg, vis_dir=None, batch_transform=None):
 
     batch_loss    = AverageMeter()
     model.eval()
@@ -45,6 +49,8 @@ def test_epoch(epoch, model, dataloader, loss_criterion, device, cfg, vis_dir=No
     t_start = time.time()
     for batch_idx, (imgs, hms, trans, xys_gt, visis_gt, img_paths) in enumerate(tqdm(dataloader, desc='[(TEST) Epoch {}]'.format(epoch))):
         imgs = imgs.to(device)
+        if batch_transform is not None:
+            imgs = batch_transform(imgs)
         for scale, hm in hms.items():
             hms[scale] = hm.to(device)
         preds  = model(imgs)
@@ -55,4 +61,10 @@ def test_epoch(epoch, model, dataloader, loss_criterion, device, cfg, vis_dir=No
     log.info('(TEST) Epoch {epoch} Loss:{batch_loss.avg:.6f} Time:{time:.1f}(sec)'.format(epoch=epoch, batch_loss=batch_loss, time=t_elapsed))
     return {'epoch': epoch, 'loss':batch_loss.avg }
 
-
+def log_drift(results_ref, results, keys=('f1', 'accuracy', 'rmse'), txt=None):
+    if txt is not None:
+        log.info('{}'.format(txt))
+    log.info('| metric | reference | target | drift |')
+    log.info('| ------ | --------- | ------ | ----- |')
+    for key in keys:
+        log.info('| {} | {:.4f} | {:.4f} | {:+.4f} |'.format(key, results_ref[key], results[key], results[key]-results_ref[key]))
@@ -12,7 +12,7 @@ import torch
 from torch import nn
 
 from models import build_model
-from dataloaders import build_dataloader
+from dataloaders import build_dataloader, build_batch_transform, write_hard_examples
 from losses import build_loss_criteria
 from optimizers import build_optimizer_and_scheduler
 from utils import save_checkpoint, set_seed, mkdir_if_missing, count_params, AverageMeter
@@ -32,10 +32,7 @@ def update_fp1_example(epoch,
     print(vi_results['fp1_im_list_dict'])
     print(fp1_fpath)
     fp1_im_list_dict = vi_results['fp1_im_list_dict']
-    with open(fp1_fpath, 'w') as f:
-        for key, im_list in fp1_im_list_dict.items():
-            for path in im_list:
-                f.write('{}\n'.format(path))
+    write_hard_examples(fp1_fpath, [ path for im_list in fp1_im_list_dict.values() for path in im_list ])
     fp1_fpath_current = osp.splitext(fp1_fpath)[0] + '_{}.txt'.format(epoch)
     shutil.copyfile(fp1_fpath, fp1_fpath_current)
 
@@ -82,6 +79,7 @@ class Trainer(BaseRunner):
         log.info('# model params: (trainable) {}, (whole) {}'.format(count_params(self._model), count_params(self._model, only_trainable=False)))
         
         self._train_loader, self._test_loader, self._train_clip_loaders_and_gts, self._test_clip_loaders_and_gts = build_dataloader(cfg)
+        self._batch_transform = build_batch_transform(cfg)
         self._loss_criteria = build_loss_criteria(cfg)
         self._optimizer, self._scheduler = build_optimizer_and_scheduler(cfg, list(self._model.parameters())+list(self._loss_criteria.parameters()) )
 
@@ -112,7 +110,7 @@ class Trainer(BaseRunner):
     def run(self):
 
         if self._test_before_train:
-            test_epoch(0, model, test_loader, loss_criteria, self._device, cfg)
+            test_epoch(0, model, test_loader, loss_criteria, self._device, cfg, batch_transform=self._batch_transform)
         if self._inference_video_before_train:  
             self._vi_runner.run(model=self._model)
         
@@ -131,7 +129,8 @@ class Trainer(BaseRunner):
                                         self._train_loader, 
                                         self._loss_criteria, 
                                         self._optimizer, 
-                                        self._device
+                                        self._device,
+                                        batch_transform=self._batch_transform,
                             )
 
             is_best = False
@@ -141,7 +140,7 @@ class Trainer(BaseRunner):
                 if self._run_test:
                     log.info('(TEST) @ Epoch {}'.format(epoch+1))
                     torch.cuda.empty_cache()
-                    test_results = test_epoch(epoch+1, self._model, self._test_loader, self._loss_criteria, self._device, self._cfg)
+                    test_results = test_epoch(epoch+1, self._model, self._test_loader, self._loss_criteria, self._device, self._cfg, batch_transform=self._batch_transform)
                     torch.cuda.empty_cache()
 
             vi_results = {'prec': None, 'recall': None, 'f1': None, 'accuracy': None}
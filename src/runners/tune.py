@@ -0,0 +1,118 @@
+import time
+import logging
+from omegaconf import DictConfig
+import torch
+from torch.utils.data import DataLoader
+
+from dataloaders import build_dataloader, ClipWindowLoader, OrderedClipLoader
+from dataloaders.samplers import RandomSampler, SequentialClipSampler
+from detectors import build_detector
+from utils import tuning_key, save_tuned_settings, PeakMemoryMonitor
+
+from .base import BaseRunner
+
+log = logging.getLogger(__name__)
+
+def _build_clip_loader(cfg, clip_loader, batch_size, num_workers):
+    if isinstance(clip_loader, ClipWindowLoader):
+        return ClipWindowLoader(cfg, clip_loader.dataset, batch_size=batch_size, num_workers=num_workers)
+    if isinstance(clip_loader, OrderedClipLoader):
+        max_held_batches = cfg['dataloader']['sampler']['inference_video_max_held_batches']
+        sampler = SequentialClipSampler(range(len(clip_loader.dataset)), 
+                                        batch_size, 
+                                        num_workers=num_workers, 
+                                        batches_per_run=cfg['dataloader']['sampler']['inference_video_batches_per_run'], 
+                                        max_held_batches=max_held_batches)
+        return OrderedClipLoader(clip_loader.dataset, sampler, num_workers=num_workers, max_held_batches=max_held_batches)
+    sampler = RandomSampler(range(len(clip_loader.dataset)), batch_size, shuffle_batch=False, drop_last=False)
+    return DataLoader(dataset=clip_loader.dataset, 
+                      batch_sampler=sampler, 
+                      num_workers=num_workers, 
+                      pin_memory=False)
+
+@torch.no_grad()
+def measure_clip_loader(detector, clip_loader, num_windows, device):
+    '''
+    end-to-end frames/sec (loading, forward and postprocessing) and peak memory on the first num_windows windows.
+    the first batch, which includes the startup of workers, is excluded from the throughput.
+    '''
+    if device=='cuda':
+        torch.cuda.reset_peak_memory_stats()
+    cnt        = 0
+    num_frames = 0
+    t_start    = None
+    with PeakMemoryMonitor() as monitor:
+        for imgs, _, trans, _, _, _ in clip_loader:
+            detector.run_tensor(imgs, trans)
+            if t_start is None:
+                t_start = time.time()
+            else:
+                num_frames += imgs.shape[0] * detector.frames_in
+            cnt += imgs.shape[0]
+            if cnt >= num_windows:
+                break
+        if device=='cuda':
+            torch.cuda.synchronize()
+        t_elapsed = time.time() - t_start
+    result = {'fps': num_frames / t_elapsed if num_frames > 0 else 0., 
+              'peak_memory_mb': None if monitor.peak is None else monitor.peak / 2**20}
+    if device=='cuda':
+        result['peak_gpu_memory_mb'] = torch.cuda.max_memory_allocated() / 2**20
+    return result
+
+class TuneRunner(BaseRunner):
+    def __init__(self,
+                 cfg: DictConfig,
+    ):
+        super().__init__(cfg)
+        self._batch_sizes   = cfg['runner']['tuning']['batch_sizes']
+        self._num_workers   = cfg['runner']['tuning']['num_workers']
+        self._num_windows   = cfg['runner']['tuning']['num_windows']
+        self._max_memory_mb = cfg['runner']['tuning']['max_memory_mb']
+        self._cache_path    = cfg['dataloader']['tuning']['cache_path']
+        self._device        = cfg['runner']['device']
+
+        split = cfg['runner']['split']
+        if split=='train':
+            _, _, clip_loaders_and_gts, _ = build_dataloader(cfg)
+        elif split=='test':
+            _, _, _, clip_loaders_and_gts = build_dataloader(cfg)
+        else:
+            raise ValueError('unknown split: {}'.format(split))
+        if len(clip_loaders_and_gts)==0:
+            raise ValueError('no clip found in split: {}'.format(split))
+        # the longest clip, so that the sample is not shorter than num_windows if possible
+        self._clip_key = max(clip_loaders_and_gts.keys(), key=lambda key: len(clip_loaders_and_gts[key]['clip_loader'].dataset))
+        self._clip_loader = clip_loaders_and_gts[self._clip_key]['clip_loader']
+
+    def run(self):
+        detector = build_detector(self._cfg)
+        key      = tuning_key(self._cfg)
+        log.info('tuning {} on match={}, clip={}'.format(key, self._clip_key[0], self._clip_key[1]))
+
+        results = []
+        log.info('| batch size | workers | FPS | peak memory (MB) |')
+        for batch_size in self._batch_sizes:
+            for num_workers in self._num_workers:
+                clip_loader = _build_clip_loader(self._cfg, self._clip_loader, batch_size, num_workers)
+                result = measure_clip_loader(detector, clip_loader, self._num_windows, self._device)
+                del clip_loader
+                peak   = result['peak_gpu_memory_mb'] if self._device=='cuda' else result['peak_memory_mb']
+                log.info('| {} | {} | {:.1f} | {} |'.format(batch_size, num_workers, result['fps'], '-' if peak is None else '{:.0f}'.format(peak)))
+                if self._max_memory_mb is not None and peak is not None and peak > self._max_memory_mb:
+                    continue
+                results.append((result['fps'], batch_size, num_workers, peak))
+
+        if len(results)==0:
+            raise RuntimeError('no setting within runner.tuning.max_memory_mb={}'.format(self._max_memory_mb))
+        fps, batch_size, num_workers, peak = max(results, key=lambda result: result[0])
+        settings = {'inference_video_batch_size': batch_size, 
+                    'inference_video_num_workers': num_workers, 
+                    'fps': fps, 
+                    'peak_memory_mb': peak, 
+                    'device': self._device, 
+                    'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+        save_tuned_settings(self._cache_path, key, settings)
+        log.info('best: inference_video_batch_size={}, inference_video_num_workers={} ({:.1f} FPS), saved to {}'.format(batch_size, num_workers, fps, self._cache_path))
+        log.info('set dataloader.tuning.auto_apply=True to use them')
+        return settings
@@ -0,0 +1,25 @@
+import os.path as osp
+import subprocess
+import sys
+
+SRC_DIR = osp.dirname(osp.dirname(osp.abspath(__file__)))
+
+# torch<1.13 (the Dockerfile pins 1.11) has neither get_default_qconfig_mapping nor the fx API that takes example inputs
+_HIDE_NEW_QUANTIZATION_API = '''
+import sys
+import torch
+import torch.ao.quantization
+del torch.ao.quantization.get_default_qconfig_mapping
+sys.modules['torch.ao.quantization.quantize_fx'] = None
+'''
+
+def _run(code):
+    return subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, capture_output=True, text=True)
+
+def test_import_detectors_without_quantization():
+    proc = _run(_HIDE_NEW_QUANTIZATION_API + 'import detectors\n')
+    assert proc.returncode==0, proc.stderr
+
+def test_import_runners_without_quantization():
+    proc = _run(_HIDE_NEW_QUANTIZATION_API + 'import runners\n')
+    assert proc.returncode==0, proc.stderr
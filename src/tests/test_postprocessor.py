@@ -0,0 +1,41 @@
+import numpy as np
+import cv2
+import pytest
+
+from detectors.postprocessor import TracknetV2Postprocessor
+
+def _build_postprocessor(use_hm_weight):
+    cfg = {'model': {'name': 'hrnet'},
+           'detector': {'postprocessor': {'score_threshold': 0.5,
+                                          'scales': [0],
+                                          'blob_det_method': 'concomp',
+                                          'use_hm_weight': use_hm_weight,
+                                          'batched': True}},
+           'dataloader': {'heatmap': {'sigmas': [2.5]}}}
+    return TracknetV2Postprocessor(cfg)
+
+def _random_heatmaps(rng, n, h, w):
+    # smoothed noise gives blobs of various sizes and shapes, several per heatmap
+    hms = rng.random((n, h, w)).astype(np.float32)
+    hms = np.stack([ cv2.GaussianBlur(hm, (0, 0), 2.) for hm in hms ])
+    hms = (hms - hms.min(axis=(1, 2), keepdims=True)) / np.ptp(hms, axis=(1, 2), keepdims=True)
+    return hms.astype(np.float32)
+
+@pytest.mark.parametrize('use_hm_weight', [True, False])
+@pytest.mark.parametrize('h', [36, 37])
+def test_concomp_batch_is_identical_to_concomp(use_hm_weight, h):
+    postprocessor = _build_postprocessor(use_hm_weight)
+    rng = np.random.default_rng(0)
+    hms = _random_heatmaps(rng, 16, h, 64)
+
+    xys_batch, scores_batch = postprocessor._detect_blob_concomp_batch(hms)
+    num_blobs = 0
+    for hm, xys_b, scores_b in zip(hms, xys_batch, scores_batch):
+        xys, scores = postprocessor._detect_blob_concomp(hm)
+        assert len(xys_b)==len(xys)
+        for xy_b, xy in zip(xys_b, xys):
+            assert np.array_equal(xy_b, xy)
+        assert scores_b==scores
+        assert [ type(score) for score in scores_b ]==[ type(score) for score in scores ]
+        num_blobs += len(xys)
+    assert num_blobs > len(hms)
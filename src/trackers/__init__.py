@@ -1,5 +1,6 @@
 from .intra_frame_peak import IntraFramePeakTracker
 from .online import OnlineTracker
+from .adaptive_stride import AdaptiveStride
 
 __tracker_factory = {
     'intra_frame_peak': IntraFramePeakTracker,
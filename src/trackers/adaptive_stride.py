@@ -0,0 +1,39 @@
+import numpy as np
+
+from .online import OnlineTracker
+
+class AdaptiveStride:
+    '''
+    chooses the stride to the next window from the state of an online tracker.
+    the stride is widened while the ball is invisible (dead time) or moves as predicted by the track, 
+    and falls back to detector.step otherwise (hits, bounces and occlusions).
+    '''
+    def __init__(self, cfg):
+        self._base_step   = cfg['detector']['step']
+        self._dead_step   = max(self._base_step, cfg['detector']['adaptive_stride']['dead_step'])
+        self._dead_frames = cfg['detector']['adaptive_stride']['dead_frames']
+        self._easy_step   = max(self._base_step, cfg['detector']['adaptive_stride']['easy_step'])
+        self._easy_error  = cfg['detector']['adaptive_stride']['easy_error']
+        if cfg['tracker']['name']!='online':
+            raise ValueError('adaptive stride requires tracker=online')
+
+    @property
+    def base_step(self):
+        return self._base_step
+
+    def next_step(self, tracker):
+        track = tracker.track
+        fid   = tracker.fid - 1
+        if fid < 0:
+            return self._base_step
+
+        if fid+1 >= self._dead_frames and not any( track.is_visible(fid_) for fid_ in range(fid-self._dead_frames+1, fid+1) ):
+            return self._dead_step
+
+        # the motion is easy if the last frames are detected and the constant acceleration model predicts the last one
+        if fid >= 3 and not any( track.is_extrapolated(fid_) for fid_ in range(fid-3, fid+1) ) and track.is_visible(fid):
+            xy_pred = track.predict(fid-1)
+            if xy_pred is not None and np.linalg.norm(xy_pred - track.xy(fid)) < self._easy_error:
+                return self._easy_step
+
+        return self._base_step
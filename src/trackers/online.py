@@ -5,17 +5,23 @@ class Track:
         self._xy_dict    = {}
         self._score_dict = {}
         self._visi_dict  = {}
+        self._extrapolated_fids = set()
 
-    def add(self, fid, x, y, visi, score):
+    def add(self, fid, x, y, visi, score, extrapolated=False):
         self._xy_dict[fid]    = np.array([x,y])
         self._visi_dict[fid]  = visi
         self._score_dict[fid] = score
+        if extrapolated:
+            self._extrapolated_fids.add(fid)
     
     def is_visible(self, fid):
         if not fid in self._visi_dict.keys():
             #raise KeyError('fid {} not found'.format(fid))
             return False
         return self._visi_dict[fid]
+
+    def is_extrapolated(self, fid):
+        return fid in self._extrapolated_fids
     
     @property
     def last_fid(self):
@@ -27,6 +33,11 @@ class Track:
             raise KeyError('fid {} not found'.format(fid))
         return self._xy_dict[fid]
 
+    def score(self, fid):
+        if not fid in self._score_dict.keys():
+            raise KeyError('fid {} not found'.format(fid))
+        return self._score_dict[fid]
+
     def predict(self, last_fid):
         fid1 = last_fid
         fid2 = fid1 - 1
@@ -89,6 +100,28 @@ class OnlineTracker:
         self._fid += 1
         return {'x': x, 'y': y, 'visi': visi, 'score': score}
 
+    def extrapolate(self):
+        '''
+        fills a frame on which the detector has not run, with the position predicted from the track
+        '''
+        xy_pred = self._track.predict(self._fid-1)
+        if xy_pred is None:
+            x, y, visi, score = - np.inf, - np.inf, False, - np.inf
+        else:
+            x, y, visi, score = xy_pred[0], xy_pred[1], True, self._track.score(self._fid-1)
+        self._track.add(self._fid, x, y, visi, score, extrapolated=True)
+
+        self._fid += 1
+        return {'x': x, 'y': y, 'visi': visi, 'score': score, 'extrapolated': True}
+
+    @property
+    def track(self):
+        return self._track
+
+    @property
+    def fid(self):
+        return self._fid
+
     def refresh(self):
         self._fid   = 0
         self._track = Track()
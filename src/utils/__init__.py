@@ -1,8 +1,10 @@
-from .utils import save_checkpoint, set_seed, mkdir_if_missing, count_params, AverageMeter, list2txt, read_image, compute_l2_dist_mat
-from .heatmap import gen_heatmap, gen_binary_map
+from .utils import save_checkpoint, set_seed, set_num_threads, mkdir_if_missing, count_params, AverageMeter, list2txt, read_image, compute_l2_dist_mat
+from .heatmap import gen_heatmap, gen_binary_map, gen_stamp, paste_stamp, rasterize_heatmaps
 from .dataclasses import Center
-from .file import load_csv_tennis
+from .file import load_csv_tennis, save_csv_predictions
 from .refine_gt import refine_gt_clip_tennis
-from .vis import draw_frame, gen_video
+from .vis import draw_frame, gen_video, save_heatmap, TrajectoryOverlay
 from .evaluator import Evaluator
+from .async_writer import AsyncImageWriter, build_image_writer
+from .tuning import tuning_key, load_tuned_settings, save_tuned_settings, PeakMemoryMonitor
 
@@ -0,0 +1,91 @@
+import os.path as osp
+import threading
+import logging
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+
+log = logging.getLogger(__name__)
+
+def _imwrite(path, img, params):
+    return cv2.imwrite(path, img, params)
+
+class AsyncImageWriter(object):
+    '''
+    encodes and writes images in a pool of threads or processes.
+    at most max_queue_size images wait for writing, write() blocks beyond that
+    '''
+    def __init__(self,
+                 num_workers=2,
+                 max_queue_size=32,
+                 backend='thread',
+                 png_compression=1,
+                 jpeg_quality=95,
+    ):
+        if backend=='thread':
+            self._executor = ThreadPoolExecutor(max_workers=num_workers)
+        elif backend=='process':
+            self._executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=mp.get_context('spawn'))
+        else:
+            raise ValueError('unknown backend: {}'.format(backend))
+        self._semaphore = threading.BoundedSemaphore(max_queue_size)
+        self._png_params  = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        self._jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self._lock      = threading.Lock()
+        self._failures  = []
+        self._num_written = 0
+
+    def _get_params(self, path):
+        ext = osp.splitext(path)[1].lower()
+        if ext=='.png':
+            return self._png_params
+        elif ext in ['.jpg', '.jpeg']:
+            return self._jpeg_params
+        return []
+
+    def write(self, path, img):
+        self._semaphore.acquire()
+        try:
+            future = self._executor.submit(_imwrite, path, img, self._get_params(path))
+        except Exception:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda future: self._on_done(path, future))
+
+    def _on_done(self, path, future):
+        self._semaphore.release()
+        error = future.exception()
+        with self._lock:
+            if error is None and future.result():
+                self._num_written += 1
+                return
+            self._failures.append(path)
+        if error is None:
+            log.warning('Failed to write image to {}'.format(path))
+        else:
+            log.warning('Failed to write image to {}: {}'.format(path, error))
+
+    def close(self):
+        # waits for all pending writes, and returns the paths that could not be written
+        self._executor.shutdown(wait=True)
+        if len(self._failures) > 0:
+            log.warning('{} of {} images could not be written'.format(len(self._failures), len(self._failures)+self._num_written))
+        return self._failures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def failures(self):
+        return self._failures
+
+def build_image_writer(cfg):
+    writer_cfg = cfg['runner']['image_writer']
+    return AsyncImageWriter(num_workers=writer_cfg['num_workers'],
+                            max_queue_size=writer_cfg['max_queue_size'],
+                            backend=writer_cfg['backend'],
+                            png_compression=writer_cfg['png_compression'],
+                            jpeg_quality=writer_cfg['jpeg_quality'])
@@ -1,3 +1,4 @@
+import copy
 import numpy as np
 import logging
 
@@ -11,42 +12,102 @@ class Evaluator(object):
         self._fp2 = 0
         self._tn  = 0
         self._fn  = 0
-        self._ses = [] # squared error
+        # per-clip arrays, concatenated when metrics are computed
+        self._ses    = [] # squared error
         self._scores = []
         self._ys     = []
 
+    def eval_clip(self, xys_pred, visis_pred, scores_pred, xys_gt, visis_gt, ranked=None):
+        '''
+        evaluates N frames at once. xys_*: (N,2), visis_*, scores_pred: (N,)
+        ranked: (N,) frames whose predictions are ranked for AP, all if None (e.g. extrapolated frames have no detector score)
+        returns per-frame arrays of tp, tn, fp1, fp2, fn and se (nan if not computed)
+        '''
+        xys_pred    = np.asarray(xys_pred, dtype=np.float64).reshape(-1, 2)
+        xys_gt      = np.asarray(xys_gt, dtype=np.float64).reshape(-1, 2)
+        visis_pred  = np.asarray(visis_pred, dtype=bool).reshape(-1)
+        visis_gt    = np.asarray(visis_gt, dtype=bool).reshape(-1)
+        scores_pred = np.asarray(scores_pred).reshape(-1)
+
+        diffs = xys_pred - xys_gt
+        # row-wise dot products, the same arithmetic as np.linalg.norm of each row
+        dists = np.sqrt( (diffs[:, None, :] @ diffs[:, :, None]).reshape(-1) )
+        both  = visis_gt & visis_pred
+        tp    = both & (dists < self._dist_threshold)
+        fp1   = both & ~tp
+        fp2   = ~visis_gt & visis_pred
+        tn    = ~visis_gt & ~visis_pred
+        fn    = visis_gt & ~visis_pred
+        ses   = np.where(both, dists**2, np.nan)
+
+        self._tp  += int(tp.sum())
+        self._fp1 += int(fp1.sum())
+        self._fp2 += int(fp2.sum())
+        self._tn  += int(tn.sum())
+        self._fn  += int(fn.sum())
+        self._ses.append(ses[both])
+        # every ranked frame with a visible prediction is a detection for AP
+        dets = visis_pred if ranked is None else visis_pred & np.asarray(ranked, dtype=bool).reshape(-1)
+        self._scores.append(scores_pred[dets])
+        self._ys.append(tp[dets].astype(np.int64))
+
+        return {'tp': tp, 'tn': tn, 'fp1': fp1, 'fp2': fp2, 'fn': fn, 'se': ses}
+
     def eval_single_frame(self, xy_pred, visi_pred, score_pred, xy_gt, visi_gt):
-        tp, fp1, fp2, tn, fn = 0, 0, 0, 0, 0
-        se = None
-        if visi_gt:
-            if visi_pred:
-                if np.linalg.norm( np.array(xy_pred)-np.array(xy_gt) ) < self._dist_threshold:
-                    tp += 1
-                else:
-                    fp1 += 1
-                se = np.linalg.norm( np.array(xy_pred)-np.array(xy_gt) )**2
-                self._ses.append(se)
-            else:
-                fn += 1
-        else:
-            if visi_pred:
-                fp2 += 1
-            else:
-                tn += 1
-        self._tp  += tp
-        self._fp1 += fp1
-        self._fp2 += fp2
-        self._tn  += tn
-        self._fn  += fn
-
-        if tp > 0 or fp1 > 0 or fp2 > 0:
-            if tp > 0:
-                self._ys.append(1)
-            else:
-                self._ys.append(0)
-            self._scores.append(score_pred)
-
-        return {'tp': tp, 'tn': tn, 'fp1': fp1, 'fp2': fp2, 'fn': fn, 'se': se}
+        result = self.eval_clip([xy_pred], [visi_pred], [score_pred], [xy_gt], [visi_gt])
+        se     = result['se'][0]
+        return {'tp': int(result['tp'][0]), 
+                'tn': int(result['tn'][0]), 
+                'fp1': int(result['fp1'][0]), 
+                'fp2': int(result['fp2'][0]), 
+                'fn': int(result['fn'][0]), 
+                'se': None if np.isnan(se) else se}
+
+    def state_dict(self):
+        return {'dist_threshold': self._dist_threshold,
+                'tp': self._tp,
+                'fp1': self._fp1,
+                'fp2': self._fp2,
+                'tn': self._tn,
+                'fn': self._fn,
+                'ses': self.sq_errs,
+                'scores': self._concat(self._scores),
+                'ys': self._concat(self._ys, np.int64)}
+
+    def load_state_dict(self, state_dict):
+        self._dist_threshold = state_dict['dist_threshold']
+        self._tp     = state_dict['tp']
+        self._fp1    = state_dict['fp1']
+        self._fp2    = state_dict['fp2']
+        self._tn     = state_dict['tn']
+        self._fn     = state_dict['fn']
+        self._ses    = [np.asarray(state_dict['ses'], dtype=np.float64)]
+        self._scores = [np.asarray(state_dict['scores'])]
+        self._ys     = [np.asarray(state_dict['ys'], dtype=np.int64)]
+
+    def __iadd__(self, other):
+        if self._dist_threshold!=other._dist_threshold:
+            raise ValueError('dist_threshold mismatch: {} vs {}'.format(self._dist_threshold, other._dist_threshold))
+        self._tp  += other._tp
+        self._fp1 += other._fp1
+        self._fp2 += other._fp2
+        self._tn  += other._tn
+        self._fn  += other._fn
+        self._ses.extend(other._ses)
+        self._scores.extend(other._scores)
+        self._ys.extend(other._ys)
+        return self
+
+    def __add__(self, other):
+        evaluator = copy.deepcopy(self)
+        evaluator += other
+        return evaluator
+
+    @staticmethod
+    def _concat(arrays, dtype=np.float64):
+        if len(arrays)==0:
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate(arrays)
 
     @property
     def dist_threshold(self):
@@ -106,37 +167,32 @@ class Evaluator(object):
 
     @property
     def sq_errs(self):
-        return self._ses
+        return self._concat(self._ses, np.float64)
 
     @property
     def ap(self):
         if (self.tp_all + self.fn_all) == 0:
             return 0.0  # 如果没有正样本，AP为0
-        
-        inds = np.argsort(-1 * np.array(self._scores)).tolist()
-        tp   = 0
-        r2p  = {}
-        for i, ind in enumerate(inds, start=1):
-            tp += self._ys[ind]
-            p   = tp / i
-            r   = tp / (self.tp_all + self.fn_all)
-            if not r in r2p.keys():
-                r2p[r] = p
-            else:
-                if r2p[r] < p:
-                    r2p[r] = p
-        prev_r = 0
-        ap = 0.
-        for r, p in r2p.items():
-            ap += (r-prev_r) * p
-            prev_r = r
-        return ap
+
+        scores = self._concat(self._scores)
+        ys     = self._concat(self._ys, np.int64)
+        if len(scores)==0:
+            return 0.
+        inds = np.argsort(-1 * scores)
+        tps  = np.cumsum(ys[inds])
+        ps   = tps / np.arange(1, len(inds)+1)
+        rs   = tps / (self.tp_all + self.fn_all)
+        # for each recall, the best precision is at its first rank
+        firsts  = np.flatnonzero( np.diff(tps, prepend=-1) )
+        prev_rs = np.concatenate([[0.], rs[firsts][:-1]])
+        return np.cumsum( (rs[firsts] - prev_rs) * ps[firsts] )[-1]
 
     @property
     def rmse(self):
         _rmse = - np.inf
-        if len(self.sq_errs) > 0:
-            _rmse = np.sqrt(np.array(self.sq_errs).mean())
+        ses   = self.sq_errs
+        if len(ses) > 0:
+            _rmse = np.sqrt(ses.mean())
         return _rmse
 
     def print_results(self, txt=None, elapsed_time=0., num_frames=0, with_ap=True):
@@ -168,4 +168,22 @@ def load_csv_tennis(csv_path, visible_flags, frame_dir=None):
                      'frame_path': frame_path
                      }
 
-    return xyvs
\ No newline at end of file
+    return xyvs
+
+
+def save_csv_predictions(csv_path, fnames, results):
+    # frames predicted by the tracker where the detector has not run (adaptive stride) are marked
+    with_extrapolated = any( result.get('extrapolated', False) for result in results )
+    rows = []
+    for fname, result in zip(fnames, results):
+        row = {'file name': fname,
+               'x-coordinate': result['x'],
+               'y-coordinate': result['y'],
+               'visibility': 1 if result['visi'] else 0,
+               'score': result['score'],
+               }
+        if with_extrapolated:
+            row['extrapolated'] = 1 if result.get('extrapolated', False) else 0
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    df.to_csv(csv_path, index=False)
@@ -2,6 +2,7 @@ from typing import Tuple
 from PIL import Image
 import numpy as np
 import cv2
+import torch
 
 def gen_binary_map(wh: Tuple[int, int],
                    cxy: Tuple[float, float],
@@ -36,3 +37,68 @@ def gen_heatmap(wh: Tuple[int, int],
     heatmap[heatmap > 1] = 1.
     return heatmap.astype(data_type)
 
+def gen_stamp(r: float,
+              binary: bool = True,
+              data_type: np.dtype = np.float32,
+              min_value: float = 0.7,
+):
+    '''
+    values of gen_binary_map (binary=True) or gen_heatmap around an integer center, 
+    the center is at (radius, radius) of the (2*radius+1, 2*radius+1) stamp
+    '''
+    if binary:
+        max_dist2 = r**2
+    elif min_value > 0.5 * np.exp(-1.):
+        # the smallest value kept by gen_heatmap is 0.5
+        max_dist2 = r**2 * (1. + np.log(min_value / 0.5))
+    else:
+        max_dist2 = 0.
+    radius = int(np.floor(np.sqrt(max_dist2))) + 1
+    x, y   = np.meshgrid(np.arange(-radius, radius+1, dtype=np.float64), np.arange(-radius, radius+1, dtype=np.float64))
+    distmap = y**2 + x**2
+    if binary:
+        stamp = np.zeros_like(distmap)
+        stamp[distmap <= r**2] = 1
+    else:
+        stamp = np.exp(-distmap/r**2 ) / np.exp(-1.) * min_value
+        stamp[stamp < 0.5] = 0
+        stamp[stamp > 1] = 1.
+    return stamp.astype(data_type)
+
+def paste_stamp(out: np.ndarray,
+                stamp: np.ndarray,
+                cxy: Tuple[int, int],
+):
+    '''
+    writes stamp centered at the integer cxy to out (h, w), the rest of out is left as is
+    '''
+    h, w   = out.shape
+    radius = stamp.shape[0] // 2
+    cx, cy = int(cxy[0]), int(cxy[1])
+    x1, y1 = max(cx - radius, 0), max(cy - radius, 0)
+    x2, y2 = min(cx + radius + 1, w), min(cy + radius + 1, h)
+    if x1 >= x2 or y1 >= y2:
+        return out
+    out[y1:y2, x1:x2] = stamp[y1-cy+radius:y2-cy+radius, x1-cx+radius:x2-cx+radius]
+    return out
+
+def rasterize_heatmaps(targets: torch.Tensor,
+                       r: float,
+                       min_value: float = 0.7,
+):
+    '''
+    dense heatmaps (B, N, h, w) from sparse targets (B, N, 6) of (cx, cy, visible, binary, w, h) in output coordinates, 
+    the batched counterpart of gen_binary_map (binary=1) and gen_heatmap (binary=0)
+    '''
+    w, h    = int(targets[0,0,4]), int(targets[0,0,5])
+    xs      = torch.arange(w, device=targets.device, dtype=targets.dtype)
+    ys      = torch.arange(h, device=targets.device, dtype=targets.dtype)
+    cx      = targets[..., 0, None, None]
+    cy      = targets[..., 1, None, None]
+    distmap = (ys[:, None] - cy)**2 + (xs[None, :] - cx)**2
+    bmap    = (distmap <= r**2).to(targets.dtype)
+    heatmap = torch.exp(-distmap/r**2) / np.exp(-1.) * min_value
+    heatmap = torch.where(heatmap < 0.5, torch.zeros_like(heatmap), heatmap).clamp(max=1.)
+    hms     = torch.where(targets[..., 3, None, None] > 0, bmap, heatmap)
+    return hms * targets[..., 2, None, None]
+
@@ -0,0 +1,98 @@
+import os
+import os.path as osp
+import json
+import time
+import socket
+import threading
+import logging
+
+from .utils import mkdir_if_missing
+
+log = logging.getLogger(__name__)
+
+def tuning_key(cfg):
+    # the memory budget is measured differently on cpu (rss) and cuda (allocated memory)
+    return '{}|{}|{}|{}x{}'.format(socket.gethostname(), cfg['runner']['device'], cfg['model']['name'], cfg['model']['inp_width'], cfg['model']['inp_height'])
+
+def load_tuned_settings(cache_path, key):
+    cache_path = osp.expanduser(cache_path)
+    if not osp.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (IOError, ValueError) as e:
+        log.warning('{} cannot be read: {}'.format(cache_path, e))
+        return None
+    return cache.get(key)
+
+def save_tuned_settings(cache_path, key, settings):
+    cache_path = osp.expanduser(cache_path)
+    cache = {}
+    if osp.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    cache[key] = settings
+    mkdir_if_missing(osp.dirname(cache_path))
+    # written to a temporary file first so that concurrent readers never see a partial file
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+def _rss_bytes(pid):
+    with open('/proc/{}/statm'.format(pid), 'r') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def _process_tree(pid):
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(name), 'r') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    pids, stack = [], [pid]
+    while len(stack) > 0:
+        pid_ = stack.pop()
+        pids.append(pid_)
+        stack.extend(children.get(pid_, []))
+    return pids
+
+class PeakMemoryMonitor(threading.Thread):
+    '''
+    samples the resident memory of this process and its descendants (e.g., dataloader workers), linux only
+    '''
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self._interval   = interval
+        self._stop_event = threading.Event()
+        self._peak       = None
+        self._available  = osp.exists('/proc/self/statm')
+
+    def run(self):
+        pid = os.getpid()
+        while self._available and not self._stop_event.is_set():
+            rss = 0
+            for pid_ in _process_tree(pid):
+                try:
+                    rss += _rss_bytes(pid_)
+                except (IOError, IndexError, ValueError):
+                    pass
+            self._peak = rss if self._peak is None else max(self._peak, rss)
+            time.sleep(self._interval)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop_event.set()
+        self.join()
+
+    @property
+    def peak(self):
+        return self._peak
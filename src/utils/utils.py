@@ -80,6 +80,16 @@ def set_seed(seed=None):
     torch.backends.cudnn.benchmark = False
     torch.backends.cudnn.deterministic = True
 
+def set_num_threads(num_threads=None, num_interop_threads=None):
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # inter-op threads can be set only once and before any inter-op parallel work starts
+            pass
+
 def _sigmoid(x):
   y = torch.clamp(x.sigmoid_(), min=1e-4, max=1-1e-4)
   return y
@@ -92,14 +102,17 @@ def _nms(heat, kernel=3):
     keep = (hmax == heat).float()
     return heat * keep
 
-def _top1(scores):
+def _topk(scores, K=1):
     batch, seq, height, width = scores.size()
-    topk_scores, topk_inds = torch.topk(scores.view(batch, seq, -1), 1)
+    topk_scores, topk_inds = torch.topk(scores.view(batch, seq, -1), K)
     topk_inds = topk_inds % (height * width)
     topk_ys   = (topk_inds / width).int().float()
     topk_xs   = (topk_inds % width).int().float()
     return topk_scores, topk_inds, topk_ys, topk_xs
 
+def _top1(scores):
+    return _topk(scores, K=1)
+
 class AverageMeter(object):
     """Computes and stores the average and current value.
        
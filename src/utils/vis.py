@@ -2,6 +2,7 @@ import os
 import os.path as osp
 from typing import Tuple
 from tqdm import tqdm
+import numpy as np
 import cv2
 
 from utils import Center
@@ -25,6 +26,39 @@ def draw_frame(img_or_path,
             img  = cv2.circle(img, (x,y), radius, color, thickness=thickness)
         
         return img
+
+class TrajectoryOverlay(object):
+    '''
+    keeps the points drawn so far on a persistent canvas, so that each new point is drawn once 
+    and the whole trajectory is composited onto a frame in one pass
+    '''
+    def __init__(self,
+                 radius : int = 5,
+                 thickness : int = -1,
+    ):
+        self._radius    = radius
+        self._thickness = thickness
+        self._canvas    = None
+        self._mask      = None
+
+    def add(self, center: Center, color: Tuple, img_shape):
+        if self._canvas is None:
+            self._canvas = np.zeros(img_shape, dtype=np.uint8)
+            self._mask   = np.zeros(img_shape[:2], dtype=np.uint8)
+        self._canvas = draw_frame(self._canvas, center=center, color=color, radius=self._radius, thickness=self._thickness)
+        self._mask   = draw_frame(self._mask, center=center, color=255, radius=self._radius, thickness=self._thickness)
+
+    def composite(self, img):
+        if self._canvas is not None:
+            np.copyto(img, self._canvas, where=self._mask[..., None] > 0)
+        return img
+
+def save_heatmap(hm_path, hm, image_writer=None):
+    # heatmaps are in [0,1], so they are stored as 8-bit images
+    hm_u8 = np.clip(hm * 255. + 0.5, 0, 255).astype(np.uint8)
+    if image_writer is not None:
+        return image_writer.write(hm_path, hm_u8)
+    return cv2.imwrite(hm_path, hm_u8)
         
 # def gen_video(video_path, 
 #               vis_dir, 